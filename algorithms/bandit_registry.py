@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class BanditRegistry():
+    """
+    Many independent bandits over the same number of arms, one per tenant
+    (e.g. per site, placement and segment), stored as rows of shared 2-D
+    arrays instead of one algorithm object each.
+
+    Tenants are the integers 0 .. n_tenants - 1; mapping real keys onto them
+    is left to the caller. Per tenant only the pulls and reward sums of each
+    arm are kept, as float32 rows of a single state buffer, so a tenant with
+    n_arms arms costs 8 * n_arms bytes (float32 counts stay exact up to
+    2**24 pulls of an arm). Everything else is derived: values are
+    reward_sums / counts, and for Bernoulli rewards the Beta posterior is
+    alpha = 1 + reward_sums, beta = 1 + counts - reward_sums, as in
+    ThompsonSampling.
+
+    policy is 'epsilon_greedy' (greedy on the empirical values, random ties
+    broken uniformly, epsilon exploration) or 'thompson'. select_arms and
+    update take arrays of tenant ids, with repeats allowed, so many tenants
+    are served per call. buffer may be an existing writable buffer of
+    state_bytes(n_tenants, n_arms) bytes to hold the state, e.g. shared
+    memory, in which case it is not reset.
+    """
+    policies = ('epsilon_greedy', 'thompson')
+
+    def __init__(self, n_tenants, n_arms, policy='thompson', epsilon=.1, rng=None, buffer=None):
+        if policy not in self.policies:
+            raise ValueError('policy must be one of {}, got {}'.format(self.policies, policy))
+        self.n_tenants = n_tenants
+        self.n_arms = n_arms
+        self.policy = policy
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng(rng)
+        if buffer is None:
+            self.state = np.zeros((2, n_tenants, n_arms), dtype=np.float32)
+        else:
+            self.state = np.ndarray((2, n_tenants, n_arms), dtype=np.float32, buffer=buffer)
+        self.counts, self.reward_sums = self.state
+
+    @staticmethod
+    def state_bytes(n_tenants, n_arms):
+        return 2 * n_tenants * n_arms * np.dtype(np.float32).itemsize
+
+    def reset(self, tenants=None):
+        """
+        Forgets everything learnt, for all tenants or only the given ones.
+        """
+        if tenants is None:
+            self.state[:] = 0
+        else:
+            self.state[:, tenants] = 0
+
+    def values(self, tenants):
+        counts = self.counts[tenants]
+        return np.divide(self.reward_sums[tenants], counts, out=np.zeros(counts.shape, dtype=np.float32),
+                         where=counts > 0)
+
+    def alpha(self, tenants):
+        return 1 + self.reward_sums[tenants]
+
+    def beta(self, tenants):
+        return 1 + self.counts[tenants] - self.reward_sums[tenants]
+
+    def select_arms(self, tenants):
+        """
+        One arm for each entry of tenants, returned in the shape of tenants
+        (a single arm for a scalar tenant).
+        """
+        shape = np.shape(tenants)
+        tenants = np.atleast_1d(tenants)
+        if self.policy == 'thompson':
+            rho = self.rng.beta(self.alpha(tenants), self.beta(tenants))
+            return np.argmax(rho, axis=-1).reshape(shape)
+        values = self.values(tenants)
+        # a random key on every arm tied for the best value breaks ties uniformly
+        best = values == values.max(axis=-1, keepdims=True)
+        chosen_arms = np.argmax(best * self.rng.random(values.shape), axis=-1)
+        explore = self.rng.random(tenants.shape) <= self.epsilon
+        chosen_arms[explore] = self.rng.integers(self.n_arms, size=explore.sum())
+        return chosen_arms.reshape(shape)
+
+    def update(self, tenants, chosen_arms, rewards):
+        """
+        Applies one reward per (tenant, arm) pair. Pairs may repeat.
+        """
+        np.add.at(self.counts, (tenants, chosen_arms), 1)
+        np.add.at(self.reward_sums, (tenants, chosen_arms), rewards)
@@ -1,36 +1,111 @@
-import random
 import math
 import numpy as np
+from random_stream import RandomStream, BLOCK_SIZE
+from index_tree import MaxTree
+from state_snapshot import state_column
 
 
 class EpsilonGreedyAnnealing():
-    def __init__(self, n_arms, annealing_factor=.0000001):
+    __slots__ = ('rng', 'annealing_factor', 'n_arms', 'state', 'total_counts', 'value_tree')
+
+    # one row of counts, values, alpha and beta per arm
+    counts = state_column(0)
+    values = state_column(1)
+    alpha = state_column(2)
+    beta = state_column(3)
+
+    def __init__(self, n_arms, annealing_factor=.0000001, rng=None, block_size=BLOCK_SIZE):
+        self.rng = RandomStream(rng, block_size)
         self.annealing_factor = annealing_factor
         self.n_arms = n_arms
-        self.counts = [0] * n_arms
-        self.values = [0.0] * n_arms
-        self.alpha = [1] * n_arms
-        self.beta = [1] * n_arms
+        self.state = np.zeros((n_arms, 4))
+        self.value_tree = MaxTree(n_arms)
+        self.reset()
 
     def reset(self):
-        self.counts = [0] * self.n_arms
-        self.values = [0.0] * self.n_arms
-        self.alpha = [1] * self.n_arms
-        self.beta = [1] * self.n_arms
+        self.state[:, :2] = 0.0
+        self.state[:, 2:] = 1.0
+        self.total_counts = 0
+        self.value_tree.reset()
 
     def select_arm(self):
-        t = sum(self.counts) + 1
+        t = self.total_counts + 1
         epsilon = 1 / math.log(t + self.annealing_factor)
-        if random.random() > epsilon:
-            return random.choice([i for i, val in enumerate(self.values) if val == max(self.values)])
+        if self.rng.random() > epsilon:
+            return self.value_tree.argmax(self.rng)
         else:
-            return random.randrange(self.n_arms)
+            return self.rng.randrange(self.n_arms)
 
     def update(self, chosen_arm, reward):
-        self.counts[chosen_arm] += 1
-        self.alpha[chosen_arm] += reward
-        self.beta[chosen_arm] += 1 - reward
-        n = float(self.counts[chosen_arm])
-        value = self.values[chosen_arm]
+        row = self.state[chosen_arm]
+        count, value, alpha, beta = row.tolist()
+        n = count + 1
         new_value = ((n - 1) / n) * value + (1 / n) * reward
-        self.values[chosen_arm] = new_value
+        row[0] = n
+        row[1] = new_value
+        row[2] = alpha + reward
+        row[3] = beta + (1 - reward)
+        self.total_counts += 1
+        self.value_tree.update(chosen_arm, new_value)
+
+    def select_arms(self, k):
+        """
+        Draws k arms from the current state, returned as an array.
+        """
+        t = self.total_counts + 1
+        epsilon = 1 / math.log(t + self.annealing_factor)
+        generator = self.rng.generator
+        best_arms = np.flatnonzero(self.values == self.values.max())
+        chosen_arms = best_arms[generator.integers(len(best_arms), size=k)]
+        explore = generator.random(k) <= epsilon
+        chosen_arms[explore] = generator.integers(self.n_arms, size=explore.sum())
+        return chosen_arms
+
+    def update_batch(self, chosen_arms, rewards):
+        chosen_arms = np.asarray(chosen_arms)
+        pulls = np.bincount(chosen_arms, minlength=self.n_arms)
+        reward_sums = np.bincount(chosen_arms, weights=rewards, minlength=self.n_arms)
+        self.total_counts += len(chosen_arms)
+        touched = np.flatnonzero(pulls)
+        counts, values, alpha, beta = self.state.T
+        counts += pulls
+        alpha += reward_sums
+        beta += pulls - reward_sums
+        values[touched] += (reward_sums[touched] - pulls[touched] * values[touched]) / counts[touched]
+        for arm in touched.tolist():
+            self.value_tree.update(arm, values[arm])
+
+    def vectorize(self, num_sims):
+        return EpsilonGreedyAnnealingVectorized(self.n_arms, num_sims, self.annealing_factor, rng=self.rng.generator)
+
+
+class EpsilonGreedyAnnealingVectorized():
+    def __init__(self, n_arms, num_sims, annealing_factor=.0000001, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.annealing_factor = annealing_factor
+        self.n_arms = n_arms
+        self.num_sims = num_sims
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((self.num_sims, self.n_arms), dtype=int)
+        self.values = np.zeros((self.num_sims, self.n_arms))
+        self.alpha = np.ones((self.num_sims, self.n_arms))
+        self.beta = np.ones((self.num_sims, self.n_arms))
+
+    def select_arms(self):
+        t = self.counts.sum(axis=1) + 1
+        epsilon = 1 / np.log(t + self.annealing_factor)
+        best = self.values == self.values.max(axis=1, keepdims=True)
+        exploit = np.argmax(best * self.rng.random(best.shape), axis=1)
+        explore = self.rng.integers(self.n_arms, size=self.num_sims)
+        return np.where(self.rng.random(self.num_sims) > epsilon, exploit, explore)
+
+    def update(self, chosen_arms, rewards):
+        sims = np.arange(self.num_sims)
+        self.counts[sims, chosen_arms] += 1
+        self.alpha[sims, chosen_arms] += rewards
+        self.beta[sims, chosen_arms] += 1 - rewards
+        n = self.counts[sims, chosen_arms]
+        value = self.values[sims, chosen_arms]
+        self.values[sims, chosen_arms] = ((n - 1) / n) * value + (1 / n) * rewards
@@ -1,39 +1,105 @@
-import random
-import math
+import numpy as np
+from random_stream import RandomStream, BLOCK_SIZE
+from fenwick_tree import LogWeightTree
+from state_snapshot import state_column
 
 
 class EXP3():
-    def __init__(self, gamma, n_arms):
+    __slots__ = ('rng', 'gamma', 'n_arms', 'state', 'weight_tree')
+
+    # one row of log_weights, alpha and beta per arm; the tree writes log_weights in place
+    log_weights = state_column(0)
+    alpha = state_column(1)
+    beta = state_column(2)
+
+    def __init__(self, gamma, n_arms, rng=None, block_size=BLOCK_SIZE):
+        self.rng = RandomStream(rng, block_size)
         self.gamma = gamma
         self.n_arms = n_arms
-        self.weights = [1.0] * n_arms
-        self.alpha = [1] * n_arms
-        self.beta = [1] * n_arms
+        self.state = np.zeros((n_arms, 3))
+        self.weight_tree = LogWeightTree(self.log_weights)
+        self.reset()
 
     def reset(self):
-        self.weights = [1.0] * self.n_arms
-        self.alpha = [1] * self.n_arms
-        self.beta = [1] * self.n_arms
+        self.state[:, 0] = 0.0
+        self.state[:, 1:] = 1.0
+        self.weight_tree.reset()
 
     def select_arm(self):
-        total_weight = sum(self.weights)
-        probs = [0.0] * self.n_arms
-        for arm in range(self.n_arms):
-            probs[arm] = (1 - self.gamma) * (self.weights[arm] / total_weight) + (self.gamma / float(self.n_arms))
-        threshold = random.random()
-        cum_prob = 0.0
-        for idx in range(len(probs)):
-            prob = probs[idx]
-            cum_prob += prob
-            if cum_prob > threshold:
-                return idx
-        return len(probs) - 1
+        # probs mix the weights with a uniform distribution, so draw from one or the other
+        if self.rng.random() < self.gamma:
+            return self.rng.randrange(self.n_arms)
+        return self.weight_tree.sample(self.rng.random())
 
     def update(self, chosen_arm, reward):
-        self.alpha[chosen_arm] += reward
-        self.beta[chosen_arm] += 1 - reward
-        total_weight = sum(self.weights)
-        x = reward / ((1 - self.gamma) * (self.weights[chosen_arm] / total_weight) + (self.gamma / float(self.n_arms)))
+        row = self.state[chosen_arm]
+        log_weight, alpha, beta = row.tolist()
+        row[1] = alpha + reward
+        row[2] = beta + (1 - reward)
+        x = reward / ((1 - self.gamma) * self.weight_tree.probability(chosen_arm) + (self.gamma / float(self.n_arms)))
+
+        # multiplying the weight by exp(gamma * x / n_arms) adds to its log
+        self.weight_tree.update(chosen_arm, log_weight + (self.gamma / self.n_arms) * x)
+
+    def select_arms(self, k):
+        """
+        Draws k arms from the current state, returned as an array.
+        """
+        weights = np.exp(self.log_weights - self.log_weights.max())
+        probs = (1 - self.gamma) * (weights / weights.sum()) + (self.gamma / float(self.n_arms))
+        threshold = self.rng.generator.random(k)
+        return np.minimum(np.searchsorted(np.cumsum(probs), threshold, side='right'), self.n_arms - 1)
+
+    def update_batch(self, chosen_arms, rewards):
+        """
+        Importance-weights every reward by the probabilities held before the
+        batch, which are the ones its decisions were drawn from.
+        """
+        chosen_arms = np.asarray(chosen_arms)
+        log_weights, alpha, beta = self.state.T
+        weights = np.exp(log_weights - log_weights.max())
+        probs = (1 - self.gamma) * (weights / weights.sum()) + (self.gamma / float(self.n_arms))
+        pulls = np.bincount(chosen_arms, minlength=self.n_arms)
+        reward_sums = np.bincount(chosen_arms, weights=rewards, minlength=self.n_arms)
+        alpha += reward_sums
+        beta += pulls - reward_sums
+        growth = (self.gamma / self.n_arms) * (reward_sums / probs)
+        for arm in np.flatnonzero(pulls).tolist():
+            self.weight_tree.update(arm, log_weights[arm] + growth[arm])
+
+    def vectorize(self, num_sims):
+        return EXP3Vectorized(self.gamma, self.n_arms, num_sims, rng=self.rng.generator)
+
+
+class EXP3Vectorized():
+    def __init__(self, gamma, n_arms, num_sims, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.gamma = gamma
+        self.n_arms = n_arms
+        self.num_sims = num_sims
+        self.reset()
+
+    def reset(self):
+        self.weights = np.ones((self.num_sims, self.n_arms))
+        self.alpha = np.ones((self.num_sims, self.n_arms))
+        self.beta = np.ones((self.num_sims, self.n_arms))
+
+    def probs(self):
+        total_weight = self.weights.sum(axis=1, keepdims=True)
+        return (1 - self.gamma) * (self.weights / total_weight) + (self.gamma / float(self.n_arms))
+
+    def select_arms(self):
+        cum_probs = np.cumsum(self.probs(), axis=1)
+        threshold = self.rng.random((self.num_sims, 1))
+        return np.minimum((cum_probs <= threshold).sum(axis=1), self.n_arms - 1)
+
+    def update(self, chosen_arms, rewards):
+        sims = np.arange(self.num_sims)
+        self.alpha[sims, chosen_arms] += rewards
+        self.beta[sims, chosen_arms] += 1 - rewards
+        x = rewards / self.probs()[sims, chosen_arms]
 
-        growth_factor = math.exp((self.gamma / self.n_arms) * x)
-        self.weights[chosen_arm] = self.weights[chosen_arm] * growth_factor
+        growth_factor = np.exp((self.gamma / self.n_arms) * x)
+        self.weights[sims, chosen_arms] *= growth_factor
+        # only the ratios between weights matter, so rescale each row to stay in range
+        self.weights /= self.weights.max(axis=1, keepdims=True)
@@ -0,0 +1,138 @@
+import math
+
+
+class FenwickTree():
+    """
+    Binary indexed tree over one non-negative weight per arm. Changing a weight
+    and drawing an arm with probability proportional to its weight both cost
+    O(log n_arms). The tree is rebuilt from the raw weights every n_arms
+    updates, which keeps the rounding error of the incremental sums bounded
+    at O(1) amortized cost. That error is relative to the largest total
+    since the last rebuild, so the tree is also rebuilt as soon as the total
+    falls below 2**-16 of it (one dominant weight collapsing).
+    """
+    def __init__(self, weights):
+        self.weights = list(weights)
+        self.n_arms = len(self.weights)
+        self.top_bit = 1 << (self.n_arms.bit_length() - 1)
+        self.tree = []
+        self.rebuild()
+
+    def reset(self, weights):
+        """
+        Replaces every weight, reusing the tree's lists.
+        """
+        self.weights[:] = weights
+        self.rebuild()
+
+    def rebuild(self):
+        self.tree[:] = [0.0] + self.weights
+        for i in range(1, self.n_arms + 1):
+            parent = i + (i & -i)
+            if parent <= self.n_arms:
+                self.tree[parent] += self.tree[i]
+        self.total = math.fsum(self.weights)
+        self.peak = self.total
+        self.updates = 0
+
+    def update(self, arm, weight):
+        delta = weight - self.weights[arm]
+        self.weights[arm] = weight
+        self.updates += 1
+        if self.updates >= self.n_arms:
+            self.rebuild()
+            return
+        self.total += delta
+        if self.total > self.peak:
+            self.peak = self.total
+        elif self.total < self.peak * 2 ** -16:
+            self.rebuild()
+            return
+        i = arm + 1
+        while i <= self.n_arms:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, n):
+        """
+        Sum of the weights of arms 0 .. n - 1.
+        """
+        total = 0.0
+        while n:
+            total += self.tree[n]
+            n -= n & -n
+        return total
+
+    def sample(self, threshold):
+        """
+        Maps a uniform draw in [0, 1) to the first arm whose cumulative weight
+        exceeds threshold * total, like walking the cumulative probabilities.
+        Once every weight has underflowed to 0 the draw is uniform instead.
+        """
+        if self.total <= 0:
+            return min(int(threshold * self.n_arms), self.n_arms - 1)
+        target = threshold * self.total
+        position = 0
+        bit = self.top_bit
+        while bit:
+            step = position + bit
+            if step <= self.n_arms and self.tree[step] <= target:
+                target -= self.tree[step]
+                position = step
+            bit >>= 1
+        return min(position, self.n_arms - 1)
+
+
+class LogWeightTree():
+    """
+    FenwickTree over weights given by their logarithms, for weights that grow
+    far beyond the float range (Hedge and EXP3 over long horizons). The tree
+    holds exp(log_weight - shift) for one shared shift, which is moved to the
+    largest log weight whenever a weight climbs more than headroom above it or
+    the total sinks below exp(-headroom). Both are rare, so updates stay
+    O(log n_arms) amortized and nothing ever overflows.
+
+    log_weights is kept by reference and written in place, so it may be a view
+    of the caller's state buffer.
+    """
+    def __init__(self, log_weights, headroom=300.0):
+        self.log_weights = log_weights
+        self.headroom = headroom
+        self.min_total = math.exp(-headroom)
+        self.tree = None
+        self.reset()
+
+    def reset(self, log_weights=None):
+        """
+        Rebuilds the tree from the held log_weights, after overwriting them
+        in place with log_weights if given.
+        """
+        if log_weights is not None:
+            self.log_weights[:] = log_weights
+        self.__rebase()
+
+    def __rebase(self):
+        self.shift = max(self.log_weights)
+        weights = [math.exp(log_weight - self.shift) for log_weight in self.log_weights]
+        if self.tree is None:
+            self.tree = FenwickTree(weights)
+        else:
+            self.tree.reset(weights)
+
+    def update(self, arm, log_weight):
+        self.log_weights[arm] = log_weight
+        if log_weight - self.shift > self.headroom:
+            self.__rebase()
+            return
+        self.tree.update(arm, math.exp(log_weight - self.shift))
+        if self.tree.total < self.min_total:
+            self.__rebase()
+
+    def log_total(self):
+        return self.shift + math.log(self.tree.total)
+
+    def probability(self, arm):
+        return math.exp(self.log_weights[arm] - self.log_total())
+
+    def sample(self, threshold):
+        return self.tree.sample(threshold)
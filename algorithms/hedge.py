@@ -1,44 +1,96 @@
-import random
-import math
+import numpy as np
+from random_stream import RandomStream, BLOCK_SIZE
+from fenwick_tree import LogWeightTree
+from state_snapshot import state_column
 
 
 class Hedge():
-    def __init__(self, temperature, n_arms):
+    __slots__ = ('rng', 'temperature', 'n_arms', 'state', 'weight_tree')
+
+    # one row of counts, values, alpha and beta per arm
+    counts = state_column(0)
+    values = state_column(1)
+    alpha = state_column(2)
+    beta = state_column(3)
+
+    def __init__(self, temperature, n_arms, rng=None, block_size=BLOCK_SIZE):
+        self.rng = RandomStream(rng, block_size)
         self.temperature = temperature
         self.n_arms = n_arms
-        self.counts = [0] * n_arms
-        self.values = [0.0] * n_arms
-        self.alpha = [1] * n_arms
-        self.beta = [1] * n_arms
+        self.state = np.zeros((n_arms, 4))
+        self.weight_tree = LogWeightTree([0.0] * n_arms)
+        self.reset()
 
     def reset(self):
-        self.counts = [0] * self.n_arms
-        self.values = [0.0] * self.n_arms
-        self.alpha = [1] * self.n_arms
-        self.beta = [1] * self.n_arms
+        self.state[:, :2] = 0.0
+        self.state[:, 2:] = 1.0
+        self.weight_tree.reset([0.0] * self.n_arms)
 
     def select_arm(self):
-        try:
-            total = sum([math.exp(value / self.temperature) for value in self.values])
-        except OverflowError:
-            total = math.inf
-        probs = []
-        for value in self.values:
-            try:
-                probs.append(math.exp(value / self.temperature) / total)
-            except OverflowError:
-                probs.append(math.inf)
-        threshold = random.random()
-        cum_prob = 0.0
-        for idx in range(len(probs)):
-            prob = probs[idx]
-            cum_prob += prob
-            if cum_prob > threshold:
-                return idx
-        return len(probs) - 1
+        return self.weight_tree.sample(self.rng.random())
 
     def update(self, chosen_arm, reward):
-        self.counts[chosen_arm] += 1
-        self.alpha[chosen_arm] += reward
-        self.beta[chosen_arm] += 1 - reward
-        self.values[chosen_arm] += reward
+        row = self.state[chosen_arm]
+        count, value, alpha, beta = row.tolist()
+        value += reward
+        row[0] = count + 1
+        row[1] = value
+        row[2] = alpha + reward
+        row[3] = beta + (1 - reward)
+        # the weight of an arm is exp(value / temperature)
+        self.weight_tree.update(chosen_arm, value / self.temperature)
+
+    def select_arms(self, k):
+        """
+        Draws k arms from the current state, returned as an array.
+        """
+        z = self.values / self.temperature
+        probs = np.exp(z - z.max())
+        cum_probs = np.cumsum(probs / probs.sum())
+        threshold = self.rng.generator.random(k)
+        return np.minimum(np.searchsorted(cum_probs, threshold, side='right'), self.n_arms - 1)
+
+    def update_batch(self, chosen_arms, rewards):
+        chosen_arms = np.asarray(chosen_arms)
+        pulls = np.bincount(chosen_arms, minlength=self.n_arms)
+        reward_sums = np.bincount(chosen_arms, weights=rewards, minlength=self.n_arms)
+        counts, values, alpha, beta = self.state.T
+        counts += pulls
+        alpha += reward_sums
+        beta += pulls - reward_sums
+        values += reward_sums
+        for arm in np.flatnonzero(pulls).tolist():
+            self.weight_tree.update(arm, values[arm] / self.temperature)
+
+    def vectorize(self, num_sims):
+        return HedgeVectorized(self.temperature, self.n_arms, num_sims, rng=self.rng.generator)
+
+
+class HedgeVectorized():
+    def __init__(self, temperature, n_arms, num_sims, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.temperature = temperature
+        self.n_arms = n_arms
+        self.num_sims = num_sims
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((self.num_sims, self.n_arms), dtype=int)
+        self.values = np.zeros((self.num_sims, self.n_arms))
+        self.alpha = np.ones((self.num_sims, self.n_arms))
+        self.beta = np.ones((self.num_sims, self.n_arms))
+
+    def select_arms(self):
+        # shifting by the row max keeps exp() finite without changing the probabilities
+        z = self.values / self.temperature
+        probs = np.exp(z - z.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        threshold = self.rng.random((self.num_sims, 1))
+        return np.minimum((np.cumsum(probs, axis=1) <= threshold).sum(axis=1), self.n_arms - 1)
+
+    def update(self, chosen_arms, rewards):
+        sims = np.arange(self.num_sims)
+        self.counts[sims, chosen_arms] += 1
+        self.alpha[sims, chosen_arms] += rewards
+        self.beta[sims, chosen_arms] += 1 - rewards
+        self.values[sims, chosen_arms] += rewards
@@ -0,0 +1,199 @@
+import heapq
+import math
+
+# Below TREE_ARMS arms UCB1 and UCB2 scan their indices instead of searching
+# an UpperBoundTree: a Python scan is fastest under SCAN_ARMS arms, a numpy
+# one from there up to at least 4096 arms (measured per decision).
+SCAN_ARMS = 32
+TREE_ARMS = 4096
+
+
+class MaxTree():
+    """
+    Segment tree over one value per arm, keeping the maximum of every subtree
+    and how many leaves reach it. Updating an arm and drawing uniformly among
+    the tied best arms both cost O(log n_arms).
+    """
+    def __init__(self, n_arms, value=0.0):
+        self.n_arms = n_arms
+        self.size = 1 << max(0, (n_arms - 1).bit_length())
+        self.max = [-math.inf] * (2 * self.size)
+        self.count = [0] * (2 * self.size)
+        self.reset(value)
+
+    def reset(self, value=0.0):
+        """
+        Sets every arm back to value, reusing the tree's lists.
+        """
+        leaves = slice(self.size, self.size + self.n_arms)
+        self.max[leaves] = [value] * self.n_arms
+        self.count[leaves] = [1] * self.n_arms
+        for node in range(self.size - 1, 0, -1):
+            self.__pull(node)
+
+    def __pull(self, node):
+        left, right = self.max[2 * node], self.max[2 * node + 1]
+        if left > right:
+            self.max[node] = left
+            self.count[node] = self.count[2 * node]
+        elif right > left:
+            self.max[node] = right
+            self.count[node] = self.count[2 * node + 1]
+        else:
+            self.max[node] = left
+            self.count[node] = self.count[2 * node] + self.count[2 * node + 1]
+
+    def update(self, arm, value):
+        node = self.size + arm
+        self.max[node] = value
+        node //= 2
+        while node:
+            self.__pull(node)
+            node //= 2
+
+    def argmax(self, rng):
+        """
+        Returns one of the arms holding the maximum, each tied arm being equally likely.
+        """
+        node = 1
+        while node < self.size:
+            left = 2 * node
+            if self.max[left] != self.max[node]:
+                node = left + 1
+            elif self.max[left + 1] != self.max[node]:
+                node = left
+            else:
+                node = left if rng.random() * self.count[node] < self.count[left] else left + 1
+        return node - self.size
+
+
+class UpperBoundTree():
+    """
+    Segment tree for indices of the form value + bonus(weight), where bonus is
+    increasing and shared by every arm but changes between decisions (as the
+    UCB curiosity bonus does with the total count).
+
+    Arms with identical (value, weight) always have identical indices, so they
+    share one leaf holding their tie set. Each node keeps the largest value and
+    the largest weight below it, which bounds every index in the subtree, and
+    how many arms reach both maxima (those attain the bound exactly). A
+    best-first search then only opens the subtrees that can still hold the
+    maximum, and tied arms are counted rather than enumerated.
+    """
+    def __init__(self, n_arms, value=0.0, weight=-math.inf):
+        self.n_arms = n_arms
+        self.size = 1 << max(0, (n_arms - 1).bit_length())
+        self.value = [-math.inf] * (2 * self.size)
+        self.weight = [-math.inf] * (2 * self.size)
+        self.count = [0] * (2 * self.size)
+        # tie sets: leaf -> arms, (value, weight) -> leaf, arm -> (leaf, position)
+        self.members = [[] for leaf in range(self.size)]
+        self.leaf_of_key = {}
+        self.arm_leaf = [None] * n_arms
+        self.arm_position = [0] * n_arms
+        self.free_leaves = []
+        self.reset(value, weight)
+
+    def reset(self, value=0.0, weight=-math.inf):
+        """
+        Sets every arm back to (value, weight), reusing the tree's lists.
+        All arms then share leaf 0, so only the path above it changes.
+        """
+        self.value[:] = [-math.inf] * (2 * self.size)
+        self.weight[:] = [-math.inf] * (2 * self.size)
+        self.count[:] = [0] * (2 * self.size)
+        for members in self.members:
+            members.clear()
+        self.leaf_of_key.clear()
+        self.free_leaves[:] = range(self.size - 1, 0, -1)
+        self.leaf_of_key[(value, weight)] = 0
+        self.members[0].extend(range(self.n_arms))
+        self.arm_leaf[:] = [0] * self.n_arms
+        self.arm_position[:] = range(self.n_arms)
+        self.__set_leaf(0, value, weight)
+
+    def __pull(self, node):
+        left, right = 2 * node, 2 * node + 1
+        value = max(self.value[left], self.value[right])
+        weight = max(self.weight[left], self.weight[right])
+        count = 0
+        if self.value[left] == value and self.weight[left] == weight:
+            count += self.count[left]
+        if self.value[right] == value and self.weight[right] == weight:
+            count += self.count[right]
+        self.value[node] = value
+        self.weight[node] = weight
+        self.count[node] = count
+
+    def __set_leaf(self, leaf, value, weight):
+        node = self.size + leaf
+        self.value[node] = value
+        self.weight[node] = weight
+        self.count[node] = len(self.members[leaf])
+        node //= 2
+        while node:
+            self.__pull(node)
+            node //= 2
+
+    def __remove(self, arm):
+        leaf = self.arm_leaf[arm]
+        members = self.members[leaf]
+        # swap-remove keeps removal O(1)
+        last = members.pop()
+        if last != arm:
+            position = self.arm_position[arm]
+            members[position] = last
+            self.arm_position[last] = position
+        node = self.size + leaf
+        if members:
+            self.__set_leaf(leaf, self.value[node], self.weight[node])
+        else:
+            del self.leaf_of_key[(self.value[node], self.weight[node])]
+            self.free_leaves.append(leaf)
+            self.__set_leaf(leaf, -math.inf, -math.inf)
+
+    def update(self, arm, value, weight):
+        if self.arm_leaf[arm] is not None:
+            self.__remove(arm)
+        key = (value, weight)
+        leaf = self.leaf_of_key.get(key)
+        if leaf is None:
+            leaf = self.free_leaves.pop()
+            self.leaf_of_key[key] = leaf
+        self.arm_leaf[arm] = leaf
+        self.arm_position[arm] = len(self.members[leaf])
+        self.members[leaf].append(arm)
+        self.__set_leaf(leaf, value, weight)
+
+    def argmax(self, bonus, rng):
+        """
+        Returns one of the arms maximizing value + bonus(weight), ties broken uniformly.
+        """
+        heap = [(-(self.value[1] + bonus(self.weight[1])), 1)]
+        best = -math.inf
+        tied = []
+        while heap:
+            bound, node = heapq.heappop(heap)
+            bound = -bound
+            if bound < best:
+                break
+            if self.count[node]:
+                # some arms below reach the bound exactly; the rest fall short of it
+                best = bound
+                tied.append(node)
+                continue
+            for child in (2 * node, 2 * node + 1):
+                if self.weight[child] > -math.inf:
+                    heapq.heappush(heap, (-(self.value[child] + bonus(self.weight[child])), child))
+
+        threshold = rng.random() * sum(self.count[node] for node in tied)
+        for node in tied:
+            threshold -= self.count[node]
+            if threshold < 0:
+                break
+        while node < self.size:
+            left = 2 * node
+            left_count = self.count[left] if self.value[left] == self.value[node] and self.weight[left] == self.weight[node] else 0
+            right_count = self.count[left + 1] if self.value[left + 1] == self.value[node] and self.weight[left + 1] == self.weight[node] else 0
+            node = left if rng.random() * (left_count + right_count) < left_count else left + 1
+        return rng.choice(self.members[node - self.size])
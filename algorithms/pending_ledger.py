@@ -0,0 +1,91 @@
+import numpy as np
+from thompson_sampling import arm_of
+
+
+class PendingLedger():
+    """
+    Decisions of an algorithm still waiting for their reward, by decision id.
+
+    select_arm/select_arms hand out an id with every arm. Rewards reported
+    later through record_rewards are matched to their decision by id, in
+    any order, and applied to the algorithm with one update_batch call per
+    report. Ids that are unknown, already resolved or expired are counted
+    in unmatched and otherwise ignored. expire() resolves decisions whose
+    reward never came (e.g. no conversion within the attribution window)
+    with a default reward.
+
+    Ids increase in issue order and issue times must not decrease, so the
+    oldest pending decisions are always at the front of the ledger.
+    """
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.reset()
+
+    def reset(self):
+        self.next_id = 0
+        # id -> (arm, issued_at); dicts keep insertion order, which is issue order
+        self.pending = {}
+        self.resolved = 0
+        self.expired = 0
+        self.unmatched = 0
+        self.max_pending = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def select_arm(self, now=None):
+        """
+        Returns (decision_id, arm) for one decision.
+        """
+        arm = arm_of(self.algorithm.select_arm())
+        decision_id = self.next_id
+        self.next_id += 1
+        self.pending[decision_id] = (arm, now)
+        if len(self.pending) > self.max_pending:
+            self.max_pending = len(self.pending)
+        return decision_id, arm
+
+    def select_arms(self, k, now=None):
+        """
+        Returns (decision_ids, arms) for k decisions made from the same state.
+        """
+        arms = np.asarray(self.algorithm.select_arms(k))
+        decision_ids = np.arange(self.next_id, self.next_id + k)
+        self.next_id += k
+        self.pending.update(zip(decision_ids.tolist(), zip(arms.tolist(), [now] * k)))
+        if len(self.pending) > self.max_pending:
+            self.max_pending = len(self.pending)
+        return decision_ids, arms
+
+    def record_rewards(self, decision_ids, rewards):
+        """
+        Applies the rewards of the given decisions in one batch. Returns how many were matched.
+        """
+        arms = []
+        matched_rewards = []
+        for decision_id, reward in zip(np.atleast_1d(decision_ids).tolist(), np.atleast_1d(rewards).tolist()):
+            entry = self.pending.pop(decision_id, None)
+            if entry is None:
+                self.unmatched += 1
+                continue
+            arms.append(entry[0])
+            matched_rewards.append(reward)
+        if arms:
+            self.algorithm.update_batch(np.array(arms), np.array(matched_rewards, dtype=float))
+            self.resolved += len(arms)
+        return len(arms)
+
+    def expire(self, before, reward=0):
+        """
+        Resolves every pending decision issued before `before` with reward.
+        Returns how many expired.
+        """
+        decision_ids = []
+        for decision_id, (arm, issued_at) in self.pending.items():
+            if issued_at is None or issued_at >= before:
+                break
+            decision_ids.append(decision_id)
+        count = self.record_rewards(decision_ids, np.full(len(decision_ids), reward))
+        self.resolved -= count
+        self.expired += count
+        return count
@@ -0,0 +1,55 @@
+import numpy as np
+
+# uniforms pre-drawn per refill; 64 keeps the block at 512 bytes per instance
+BLOCK_SIZE = 64
+
+
+class RandomStream():
+    """
+    Drop-in for the few `random` module calls the algorithms and the trials
+    make, backed by a numpy Generator. Scalar draws are handed out from a
+    pre-drawn block of block_size uniforms (or standard normals for gauss),
+    refilled in place, so a draw costs an array lookup instead of one RNG
+    call. The block is read in the generator's own
+    order, so block_size does not change the draws.
+
+    rng may be None, a seed or an existing np.random.Generator, which is used
+    as is; many instances can share one.
+    """
+    def __init__(self, rng=None, block_size=BLOCK_SIZE):
+        self.generator = np.random.default_rng(rng)
+        self.block_size = block_size
+        # allocated on the first draw, so an instance which never decides doesn't pay for it
+        self.__uniforms = None
+        self.__next = block_size
+        self.__normals = None
+        self.__next_normal = block_size
+
+    def random(self):
+        if self.__next == self.block_size:
+            if self.__uniforms is None:
+                self.__uniforms = np.empty(self.block_size)
+            self.generator.random(out=self.__uniforms)
+            self.__next = 0
+        value = self.__uniforms.item(self.__next)
+        self.__next += 1
+        return value
+
+    def gauss(self, mu, sigma):
+        if self.__next_normal == self.block_size:
+            if self.__normals is None:
+                self.__normals = np.empty(self.block_size)
+            self.generator.standard_normal(out=self.__normals)
+            self.__next_normal = 0
+        value = self.__normals.item(self.__next_normal)
+        self.__next_normal += 1
+        return mu + sigma * value
+
+    def randrange(self, n):
+        return int(self.random() * n)
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def betavariates(self, alpha, beta):
+        return self.generator.beta(alpha, beta)
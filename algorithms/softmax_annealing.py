@@ -1,41 +1,131 @@
-import random
 import math
+import numpy as np
+from random_stream import RandomStream, BLOCK_SIZE
+from fenwick_tree import FenwickTree
+from state_snapshot import state_column
 
 
 class SoftmaxAnnealing():
-    def __init__(self, n_arms, annealing_factor=.0000001):
+    __slots__ = ('rng', 'annealing_factor', 'n_arms', 'state', 'total_counts', 'tree_inverse_temperature',
+                 'weight_tree', 'min_value', 'max_value')
+
+    # one row of counts, values, alpha and beta per arm
+    counts = state_column(0)
+    values = state_column(1)
+    alpha = state_column(2)
+    beta = state_column(3)
+
+    def __init__(self, n_arms, annealing_factor=.0000001, rng=None, block_size=BLOCK_SIZE):
+        self.rng = RandomStream(rng, block_size)
         self.annealing_factor = annealing_factor
         self.n_arms = n_arms
-        self.counts = [0] * n_arms
-        self.values = [0.0] * n_arms
-        self.alpha = [1] * n_arms
-        self.beta = [1] * n_arms
+        self.state = np.zeros((n_arms, 4))
+        self.weight_tree = FenwickTree([1.0] * n_arms)
+        self.reset()
 
     def reset(self):
-        self.counts = [0] * self.n_arms
-        self.values = [0.0] * self.n_arms
-        self.alpha = [1] * self.n_arms
-        self.beta = [1] * self.n_arms
+        self.state[:, :2] = 0.0
+        self.state[:, 2:] = 1.0
+        self.total_counts = 0
+        self.__rebuild(0.0)
+
+    def __rebuild(self, inverse_temperature):
+        # the tree holds exp(value / temperature) for the temperature at the last rebuild
+        values = self.values
+        self.tree_inverse_temperature = inverse_temperature
+        self.weight_tree.reset(np.exp(values * inverse_temperature).tolist())
+        self.min_value = values.min()
+        self.max_value = values.max()
 
     def select_arm(self):
-        t = sum(self.counts) + 1
-        temperature = 1 / math.log(t + self.annealing_factor)
-        total = sum([math.exp(value / temperature) for value in self.values])
-        probs = [math.exp(value / temperature) / total for value in self.values]
-        threshold = random.random()
-        cum_prob = 0.0
-        for idx in range(len(probs)):
-            prob = probs[idx]
-            cum_prob += prob
-            if cum_prob > threshold:
-                return idx
-        return len(probs) - 1
+        t = self.total_counts + 1
+        inverse_temperature = math.log(t + self.annealing_factor)
+        # the temperature only falls, so the tree's distribution is flatter than the current one.
+        # Drawing from it and accepting arm i with probability exp((value_i - max_value) * drift)
+        # samples exactly from the current softmax; rebuild once the acceptance rate could drop
+        # below about 90%.
+        drift = inverse_temperature - self.tree_inverse_temperature
+        if drift * (self.max_value - self.min_value) > .1:
+            self.__rebuild(inverse_temperature)
+            drift = 0.0
+        while True:
+            arm = self.weight_tree.sample(self.rng.random())
+            if drift == 0.0 or self.rng.random() < math.exp((self.state.item(arm, 1) - self.max_value) * drift):
+                return arm
 
     def update(self, chosen_arm, reward):
-        self.counts[chosen_arm] += 1
-        self.alpha[chosen_arm] += reward
-        self.beta[chosen_arm] += 1 - reward
-        n = float(self.counts[chosen_arm])
-        value = self.values[chosen_arm]
+        row = self.state[chosen_arm]
+        count, value, alpha, beta = row.tolist()
+        n = count + 1
         new_value = ((n - 1) / n) * value + (1 / n) * reward
-        self.values[chosen_arm] = new_value
+        row[0] = n
+        row[1] = new_value
+        row[2] = alpha + reward
+        row[3] = beta + (1 - reward)
+        self.total_counts += 1
+        # running bounds stay valid for the acceptance test even after values move back inside them
+        self.min_value = min(self.min_value, new_value)
+        self.max_value = max(self.max_value, new_value)
+        self.weight_tree.update(chosen_arm, math.exp(new_value * self.tree_inverse_temperature))
+
+    def select_arms(self, k):
+        """
+        Draws k arms from the current state, returned as an array.
+        """
+        z = self.values * math.log(self.total_counts + 1 + self.annealing_factor)
+        probs = np.exp(z - z.max())
+        cum_probs = np.cumsum(probs / probs.sum())
+        threshold = self.rng.generator.random(k)
+        return np.minimum(np.searchsorted(cum_probs, threshold, side='right'), self.n_arms - 1)
+
+    def update_batch(self, chosen_arms, rewards):
+        chosen_arms = np.asarray(chosen_arms)
+        pulls = np.bincount(chosen_arms, minlength=self.n_arms)
+        reward_sums = np.bincount(chosen_arms, weights=rewards, minlength=self.n_arms)
+        self.total_counts += len(chosen_arms)
+        touched = np.flatnonzero(pulls)
+        counts, values, alpha, beta = self.state.T
+        counts += pulls
+        alpha += reward_sums
+        beta += pulls - reward_sums
+        values[touched] += (reward_sums[touched] - pulls[touched] * values[touched]) / counts[touched]
+        self.min_value = min(self.min_value, values[touched].min())
+        self.max_value = max(self.max_value, values[touched].max())
+        for arm in touched.tolist():
+            self.weight_tree.update(arm, math.exp(values[arm] * self.tree_inverse_temperature))
+
+    def vectorize(self, num_sims):
+        return SoftmaxAnnealingVectorized(self.n_arms, num_sims, self.annealing_factor, rng=self.rng.generator)
+
+
+class SoftmaxAnnealingVectorized():
+    def __init__(self, n_arms, num_sims, annealing_factor=.0000001, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.annealing_factor = annealing_factor
+        self.n_arms = n_arms
+        self.num_sims = num_sims
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((self.num_sims, self.n_arms), dtype=int)
+        self.values = np.zeros((self.num_sims, self.n_arms))
+        self.alpha = np.ones((self.num_sims, self.n_arms))
+        self.beta = np.ones((self.num_sims, self.n_arms))
+
+    def select_arms(self):
+        t = self.counts.sum(axis=1, keepdims=True) + 1
+        temperature = 1 / np.log(t + self.annealing_factor)
+        z = self.values / temperature
+        probs = np.exp(z - z.max(axis=1, keepdims=True))
+        probs /= probs.sum(axis=1, keepdims=True)
+        threshold = self.rng.random((self.num_sims, 1))
+        return np.minimum((np.cumsum(probs, axis=1) <= threshold).sum(axis=1), self.n_arms - 1)
+
+    def update(self, chosen_arms, rewards):
+        sims = np.arange(self.num_sims)
+        self.counts[sims, chosen_arms] += 1
+        self.alpha[sims, chosen_arms] += rewards
+        self.beta[sims, chosen_arms] += 1 - rewards
+        n = self.counts[sims, chosen_arms]
+        value = self.values[sims, chosen_arms]
+        self.values[sims, chosen_arms] = ((n - 1) / n) * value + (1 / n) * rewards
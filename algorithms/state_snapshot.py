@@ -0,0 +1,43 @@
+import io
+import pickle
+import numpy as np
+
+
+class StatePickler(pickle.Pickler):
+    """
+    Pickles numpy views as views of their pickled base array, so views the
+    algorithms keep of their state buffer stay views of it once loaded.
+    """
+    def reducer_override(self, obj):
+        if isinstance(obj, np.ndarray) and isinstance(obj.base, np.ndarray):
+            offset = obj.__array_interface__['data'][0] - obj.base.__array_interface__['data'][0]
+            return view_of, (obj.base, obj.dtype, obj.shape, offset, obj.strides)
+        return NotImplemented
+
+
+def state_column(column):
+    """
+    Read-only attribute for one statistic of an algorithm's state buffer,
+    which holds one row per arm, as in `counts = state_column(0)`. The
+    column is viewed on access, so instances don't each carry an array
+    object per statistic.
+    """
+    return property(lambda self: self.state[:, column])
+
+
+def view_of(base, dtype, shape, offset, strides):
+    return np.ndarray(shape, dtype, buffer=base, offset=offset, strides=strides)
+
+
+def snapshot(objects):
+    """
+    Pickled copy of objects (e.g. an algorithm, or an algorithm with its arms)
+    which pickle.loads restores with the state buffer views intact.
+    """
+    buffer = io.BytesIO()
+    StatePickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(objects)
+    return buffer.getvalue()
+
+
+def copy_state(objects):
+    return pickle.loads(snapshot(objects))
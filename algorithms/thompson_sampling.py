@@ -1,32 +1,102 @@
-import random
 import numpy as np
+from random_stream import RandomStream
+from state_snapshot import state_column
 
 
 class ThompsonSampling():
-    def __init__(self, n_arms):
+    __slots__ = ('rng', 'n_arms', 'state')
+
+    # one row of counts, values, s_counts, alpha and beta per arm
+    counts = state_column(0)
+    values = state_column(1)
+    s_counts = state_column(2)
+    alpha = state_column(3)
+    beta = state_column(4)
+
+    def __init__(self, n_arms, rng=None):
+        self.rng = RandomStream(rng)
         self.n_arms = n_arms
-        self.counts = [0] * n_arms
-        self.values = [0.0] * n_arms
-        self.s_counts = [0] * n_arms
-        self.alpha = [1] * n_arms
-        self.beta = [1] * n_arms
+        self.state = np.zeros((n_arms, 5))
+        self.reset()
 
     def reset(self):
-        self.counts = [0] * self.n_arms
-        self.values = [0.0] * self.n_arms
-        self.s_counts = [0] * self.n_arms
-        self.alpha = [1] * self.n_arms
-        self.beta = [1] * self.n_arms
+        self.state[:, :3] = 0.0
+        self.state[:, 3:] = 1.0
 
     def select_arm(self):
-        rho = [random.betavariate(self.alpha[i], self.beta[i]) for i in range(self.n_arms)]
+        rho = self.rng.betavariates(self.alpha, self.beta)
         return rho
 
     def update(self, chosen_arm, reward):
-        self.counts[chosen_arm] += 1
-        self.alpha[chosen_arm] += reward
-        self.beta[chosen_arm] += 1 - reward
-        n = float(self.counts[chosen_arm])
-        value = self.values[chosen_arm]
+        row = self.state[chosen_arm]
+        count, value, s_count, alpha, beta = row.tolist()
+        n = count + 1
         new_value = ((n - 1) / n) * value + (1 / n) * reward
-        self.values[chosen_arm] = new_value
+        row[0] = n
+        row[1] = new_value
+        row[3] = alpha + reward
+        row[4] = beta + (1 - reward)
+
+    def select_arms(self, k):
+        """
+        Draws k arms from the current posteriors, returned as an array.
+        """
+        rho = self.rng.generator.beta(self.alpha, self.beta, size=(k, self.n_arms))
+        return np.argmax(rho, axis=1)
+
+    def update_batch(self, chosen_arms, rewards):
+        chosen_arms = np.asarray(chosen_arms)
+        pulls = np.bincount(chosen_arms, minlength=self.n_arms)
+        reward_sums = np.bincount(chosen_arms, weights=rewards, minlength=self.n_arms)
+        touched = np.flatnonzero(pulls)
+        counts, values, s_counts, alpha, beta = self.state.T
+        counts += pulls
+        alpha += reward_sums
+        beta += pulls - reward_sums
+        values[touched] += (reward_sums[touched] - pulls[touched] * values[touched]) / counts[touched]
+
+    def vectorize(self, num_sims):
+        return ThompsonSamplingVectorized(self.n_arms, num_sims, rng=self.rng.generator)
+
+
+class ThompsonSamplingVectorized():
+    def __init__(self, n_arms, num_sims, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.n_arms = n_arms
+        self.num_sims = num_sims
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((self.num_sims, self.n_arms), dtype=int)
+        self.values = np.zeros((self.num_sims, self.n_arms))
+        self.alpha = np.ones((self.num_sims, self.n_arms))
+        self.beta = np.ones((self.num_sims, self.n_arms))
+
+    def select_arms(self):
+        rho = self.rng.beta(self.alpha, self.beta)
+        return np.argmax(rho, axis=1)
+
+    def update(self, chosen_arms, rewards):
+        sims = np.arange(self.num_sims)
+        self.counts[sims, chosen_arms] += 1
+        self.alpha[sims, chosen_arms] += rewards
+        self.beta[sims, chosen_arms] += 1 - rewards
+        n = self.counts[sims, chosen_arms]
+        value = self.values[sims, chosen_arms]
+        self.values[sims, chosen_arms] = ((n - 1) / n) * value + (1 / n) * rewards
+
+
+def posterior_draw(choice):
+    """
+    The posterior draw when choice, the return value of any algorithm's
+    select_arm, comes from ThompsonSampling, which returns its draw rather
+    than an arm; None when choice is already an arm.
+    """
+    return choice if np.ndim(choice) else None
+
+
+def arm_of(choice):
+    """
+    The arm played for choice, the return value of any algorithm's select_arm.
+    """
+    return int(np.argmax(choice)) if np.ndim(choice) else int(choice)
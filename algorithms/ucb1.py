@@ -1,39 +1,136 @@
 import math
 import numpy as np
-import random
+from random_stream import RandomStream, BLOCK_SIZE
+from index_tree import UpperBoundTree, SCAN_ARMS, TREE_ARMS
+from state_snapshot import state_column
 
 
 class UCB1():
-    def __init__(self, n_arms):
+    __slots__ = ('rng', 'n_arms', 'state', 'total_counts', 'next_untried', 'ucb_tree')
+
+    # one row of counts, values, alpha and beta per arm
+    counts = state_column(0)
+    values = state_column(1)
+    alpha = state_column(2)
+    beta = state_column(3)
+
+    def __init__(self, n_arms, rng=None, block_size=BLOCK_SIZE):
+        self.rng = RandomStream(rng, block_size)
         self.n_arms = n_arms
-        self.counts = [0] * n_arms
-        self.values = [0.0] * n_arms
-        self.alpha = [1] * n_arms
-        self.beta = [1] * n_arms
+        self.state = np.zeros((n_arms, 4))
+        # small arm sets are cheaper to scan than to search
+        self.ucb_tree = UpperBoundTree(n_arms) if n_arms >= TREE_ARMS else None
+        self.reset()
 
     def reset(self):
-        self.counts = [0] * self.n_arms
-        self.values = [0.0] * self.n_arms
-        self.alpha = [1] * self.n_arms
-        self.beta = [1] * self.n_arms
+        self.state[:, :2] = 0.0
+        self.state[:, 2:] = 1.0
+        self.total_counts = 0
+        self.next_untried = 0
+        if self.ucb_tree is not None:
+            self.ucb_tree.reset()
 
     def select_arm(self):
-        n_arms = len(self.counts)
-        for arm in range(n_arms):
-            if self.counts[arm] == 0:
-                return arm
-        ucb_values = [0.0 for arm in range(n_arms)]
-        total_counts = sum(self.counts)
-        for arm in range(n_arms):
-            curiosity_bonus = math.sqrt((2 * math.log(total_counts)) / float(self.counts[arm]))
-            ucb_values[arm] = self.values[arm] + curiosity_bonus
-        return random.choice([i for i, val in enumerate(ucb_values) if val == max(ucb_values)])
+        while self.next_untried < self.n_arms and self.state.item(self.next_untried, 0) > 0:
+            self.next_untried += 1
+        if self.next_untried < self.n_arms:
+            return self.next_untried
+        if self.ucb_tree is None:
+            return self.__scan()
+        # the tree holds 1 / sqrt(count) per arm, so the bonus is a single multiplication
+        curiosity_factor = math.sqrt(2 * math.log(self.total_counts))
+        return self.ucb_tree.argmax(lambda weight: curiosity_factor * weight, self.rng)
+
+    def __scan(self):
+        log_total = 2 * math.log(self.total_counts)
+        if self.n_arms < SCAN_ARMS:
+            ucb_values = [value + math.sqrt(log_total / count) for count, value, alpha, beta in self.state.tolist()]
+            best = max(ucb_values)
+            return self.rng.choice([arm for arm, ucb_value in enumerate(ucb_values) if ucb_value == best])
+        ucb_values = self.state[:, 1] + np.sqrt(log_total / self.state[:, 0])
+        return int(self.rng.choice(np.flatnonzero(ucb_values == ucb_values.max())))
 
     def update(self, chosen_arm, reward):
-        self.counts[chosen_arm] += 1
-        self.alpha[chosen_arm] += reward
-        self.beta[chosen_arm] += 1 - reward
-        n = float(self.counts[chosen_arm])
-        value = self.values[chosen_arm]
+        row = self.state[chosen_arm]
+        count, value, alpha, beta = row.tolist()
+        n = count + 1
         new_value = ((n - 1) / n) * value + (1 / n) * reward
-        self.values[chosen_arm] = new_value
+        row[0] = n
+        row[1] = new_value
+        row[2] = alpha + reward
+        row[3] = beta + (1 - reward)
+        self.total_counts += 1
+        if self.ucb_tree is not None:
+            self.ucb_tree.update(chosen_arm, new_value, 1 / math.sqrt(n))
+
+    def select_arms(self, k):
+        """
+        Draws k arms from the current state, returned as an array. Untried
+        arms come first, one pull each. The index only changes with feedback,
+        so the rest of the batch goes to the best arm.
+        """
+        untried = self.next_untried + np.flatnonzero(self.state[self.next_untried:, 0] == 0)[:k]
+        if not len(untried):
+            return np.full(k, self.select_arm())
+        if len(untried) == k:
+            return untried
+        if not self.total_counts:
+            # nothing to rank the arms by yet, so go round the untried ones again
+            return np.resize(untried, k)
+        counts, values = self.state[:, 0], self.state[:, 1]
+        tried = np.flatnonzero(counts > 0)
+        ucb_values = values[tried] + np.sqrt(2 * math.log(self.total_counts) / counts[tried])
+        best_arm = int(self.rng.choice(tried[ucb_values == ucb_values.max()]))
+        return np.concatenate((untried, np.full(k - len(untried), best_arm)))
+
+    def update_batch(self, chosen_arms, rewards):
+        chosen_arms = np.asarray(chosen_arms)
+        pulls = np.bincount(chosen_arms, minlength=self.n_arms)
+        reward_sums = np.bincount(chosen_arms, weights=rewards, minlength=self.n_arms)
+        self.total_counts += len(chosen_arms)
+        touched = np.flatnonzero(pulls)
+        counts, values, alpha, beta = self.state.T
+        counts += pulls
+        alpha += reward_sums
+        beta += pulls - reward_sums
+        values[touched] += (reward_sums[touched] - pulls[touched] * values[touched]) / counts[touched]
+        if self.ucb_tree is not None:
+            for arm in touched.tolist():
+                self.ucb_tree.update(arm, values[arm], 1 / math.sqrt(counts[arm]))
+
+    def vectorize(self, num_sims):
+        return UCB1Vectorized(self.n_arms, num_sims, rng=self.rng.generator)
+
+
+class UCB1Vectorized():
+    def __init__(self, n_arms, num_sims, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.n_arms = n_arms
+        self.num_sims = num_sims
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((self.num_sims, self.n_arms), dtype=int)
+        self.values = np.zeros((self.num_sims, self.n_arms))
+        self.alpha = np.ones((self.num_sims, self.n_arms))
+        self.beta = np.ones((self.num_sims, self.n_arms))
+
+    def select_arms(self):
+        untried = self.counts == 0
+        total_counts = self.counts.sum(axis=1, keepdims=True)
+        # rows with an untried arm are overridden below, so their inf/nan bonuses don't matter
+        with np.errstate(divide='ignore', invalid='ignore'):
+            curiosity_bonus = np.sqrt((2 * np.log(total_counts)) / self.counts)
+        ucb_values = self.values + curiosity_bonus
+        best = ucb_values == ucb_values.max(axis=1, keepdims=True)
+        chosen_arms = np.argmax(best * self.rng.random(best.shape), axis=1)
+        return np.where(untried.any(axis=1), np.argmax(untried, axis=1), chosen_arms)
+
+    def update(self, chosen_arms, rewards):
+        sims = np.arange(self.num_sims)
+        self.counts[sims, chosen_arms] += 1
+        self.alpha[sims, chosen_arms] += rewards
+        self.beta[sims, chosen_arms] += 1 - rewards
+        n = self.counts[sims, chosen_arms]
+        value = self.values[sims, chosen_arms]
+        self.values[sims, chosen_arms] = ((n - 1) / n) * value + (1 / n) * rewards
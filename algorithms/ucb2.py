@@ -1,34 +1,44 @@
 import math
 import numpy as np
-import random
+from random_stream import RandomStream, BLOCK_SIZE
+from index_tree import UpperBoundTree, SCAN_ARMS, TREE_ARMS
+from state_snapshot import state_column
 
 
 class UCB2():
-    def __init__(self, alpha_param, n_arms):
+    __slots__ = ('rng', 'alpha_param', 'n_arms', 'state', '__current_arm', '__next_update', 'total_counts',
+                 'next_untried', 'ucb_tree')
+
+    # one row of counts, values, r, alpha and beta per arm
+    counts = state_column(0)
+    values = state_column(1)
+    r = state_column(2)
+    alpha = state_column(3)
+    beta = state_column(4)
+
+    def __init__(self, alpha_param, n_arms, rng=None, block_size=BLOCK_SIZE):
+        self.rng = RandomStream(rng, block_size)
         self.alpha_param = alpha_param
         self.n_arms = n_arms
-        self.counts = [0] * n_arms
-        self.values = [0.0] * n_arms
-        self.r = [0] * n_arms
-        self.__current_arm = 0
-        self.__next_update = 0
-        self.alpha = [1] * n_arms
-        self.beta = [1] * n_arms
+        self.state = np.zeros((n_arms, 5))
+        # small arm sets are cheaper to scan than to search
+        self.ucb_tree = UpperBoundTree(n_arms) if n_arms >= TREE_ARMS else None
+        self.reset()
 
     def reset(self):
-        self.counts = [0] * self.n_arms
-        self.values = [0.0] * self.n_arms
-        self.r = [0] * self.n_arms
+        self.state[:, :3] = 0.0
+        self.state[:, 3:] = 1.0
         self.__current_arm = 0
         self.__next_update = 0
-        self.alpha = [1] * self.n_arms
-        self.beta = [1] * self.n_arms
-        
+        self.total_counts = 0
+        self.next_untried = 0
+        if self.ucb_tree is not None:
+            self.ucb_tree.reset(weight=-self.__tau(0))
+
     def __tau(self, r):
         return int(math.ceil((1 + self.alpha_param) ** r))
     
-    def __bonus(self, n, r):
-        tau = self.__tau(r)
+    def __bonus(self, n, tau):
         bonus = math.sqrt((1. + self.alpha_param) * math.log(math.e * float(n) / tau) / (2 * tau))
         return bonus
   
@@ -37,35 +47,167 @@ class UCB2():
         When choosing a new arm, make sure we play that arm for
         tau(r+1) - tau(r) episodes.
         """
+        row = self.state[arm]
+        value, r = row.item(1), row.item(2)
         self.__current_arm = arm
-        self.__next_update += max(1, self.__tau(self.r[arm] + 1) - self.__tau(self.r[arm]))
-        self.r[arm] += 1
+        self.__next_update += max(1, self.__tau(r + 1) - self.__tau(r))
+        row[2] = r + 1
+        if self.ucb_tree is not None:
+            # the tree keeps -tau so that a larger weight means a larger bonus
+            self.ucb_tree.update(arm, value, -self.__tau(r + 1))
 
     def select_arm(self):
         # play each arm once
-        for arm in range(self.n_arms):
-            if self.counts[arm] == 0:
-                self.__set_arm(arm)
-                return arm
+        while self.next_untried < self.n_arms and self.state.item(self.next_untried, 0) > 0:
+            self.next_untried += 1
+        if self.next_untried < self.n_arms:
+            # asked again before its feedback arrived, the arm's epoch is already set
+            if self.state.item(self.next_untried, 2) == 0:
+                self.__set_arm(self.next_untried)
+            return self.next_untried
     
         # make sure we aren't still playing the previous arm.
-        if self.__next_update > sum(self.counts):
+        if self.__next_update > self.total_counts:
             return self.__current_arm
     
-        ucb_values = [0.0 for arm in range(self.n_arms)]
-        total_counts = sum(self.counts)
-        for arm in range(self.n_arms):
-            bonus = self.__bonus(total_counts, self.r[arm])
-            ucb_values[arm] = self.values[arm] + bonus
-        chosen_arm = random.choice([i for i, val in enumerate(ucb_values) if val == max(ucb_values)])
+        total_counts = self.total_counts
+        if self.ucb_tree is None:
+            chosen_arm = self.__scan(total_counts)
+        else:
+            chosen_arm = self.ucb_tree.argmax(lambda weight: self.__bonus(total_counts, -weight), self.rng)
         self.__set_arm(chosen_arm)
         return chosen_arm
 
+    def __scan(self, total_counts):
+        if self.n_arms < SCAN_ARMS:
+            ucb_values = [value + self.__bonus(total_counts, self.__tau(r))
+                          for count, value, r, alpha, beta in self.state.tolist()]
+            best = max(ucb_values)
+            return self.rng.choice([arm for arm, ucb_value in enumerate(ucb_values) if ucb_value == best])
+        tau = np.ceil((1 + self.alpha_param) ** self.state[:, 2])
+        bonus = np.sqrt((1. + self.alpha_param) * np.log(math.e * float(total_counts) / tau) / (2 * tau))
+        ucb_values = self.state[:, 1] + bonus
+        return int(self.rng.choice(np.flatnonzero(ucb_values == ucb_values.max())))
+
     def update(self, chosen_arm, reward):
-        self.counts[chosen_arm] += 1
-        self.alpha[chosen_arm] += reward
-        self.beta[chosen_arm] += 1 - reward
-        n = float(self.counts[chosen_arm])
-        value = self.values[chosen_arm]
+        row = self.state[chosen_arm]
+        count, value, r, alpha, beta = row.tolist()
+        n = count + 1
         new_value = ((n - 1) / n) * value + (1 / n) * reward
-        self.values[chosen_arm] = new_value
+        row[0] = n
+        row[1] = new_value
+        row[3] = alpha + reward
+        row[4] = beta + (1 - reward)
+        self.total_counts += 1
+        if self.ucb_tree is not None:
+            self.ucb_tree.update(chosen_arm, new_value, -self.__tau(r))
+
+    def select_arms(self, k):
+        """
+        Draws k arms from the current state, returned as an array. Untried
+        arms come first, one pull each. The index only changes with feedback,
+        so the rest of the batch goes to the best arm, starting its epoch.
+        """
+        untried = self.next_untried + np.flatnonzero(self.state[self.next_untried:, 0] == 0)[:k]
+        if not len(untried):
+            return np.full(k, self.select_arm())
+        for arm in untried.tolist():
+            # asked again before its feedback arrived, the arm's epoch is already set
+            if self.state.item(arm, 2) == 0:
+                self.__set_arm(arm)
+        if len(untried) == k:
+            return untried
+        if not self.total_counts:
+            # nothing to rank the arms by yet, so go round the untried ones again
+            return np.resize(untried, k)
+        counts, values, r = self.state[:, 0], self.state[:, 1], self.state[:, 2]
+        tried = np.flatnonzero(counts > 0)
+        tau = np.ceil((1 + self.alpha_param) ** r[tried])
+        bonus = np.sqrt((1. + self.alpha_param) * np.log(math.e * float(self.total_counts) / tau) / (2 * tau))
+        ucb_values = values[tried] + bonus
+        best_arm = int(self.rng.choice(tried[ucb_values == ucb_values.max()]))
+        self.__set_arm(best_arm)
+        return np.concatenate((untried, np.full(k - len(untried), best_arm)))
+
+    def update_batch(self, chosen_arms, rewards):
+        chosen_arms = np.asarray(chosen_arms)
+        pulls = np.bincount(chosen_arms, minlength=self.n_arms)
+        reward_sums = np.bincount(chosen_arms, weights=rewards, minlength=self.n_arms)
+        self.total_counts += len(chosen_arms)
+        touched = np.flatnonzero(pulls)
+        counts, values, r, alpha, beta = self.state.T
+        counts += pulls
+        alpha += reward_sums
+        beta += pulls - reward_sums
+        values[touched] += (reward_sums[touched] - pulls[touched] * values[touched]) / counts[touched]
+        if self.ucb_tree is not None:
+            for arm in touched.tolist():
+                self.ucb_tree.update(arm, values[arm], -self.__tau(r[arm]))
+
+    def vectorize(self, num_sims):
+        return UCB2Vectorized(self.alpha_param, self.n_arms, num_sims, rng=self.rng.generator)
+
+
+class UCB2Vectorized():
+    def __init__(self, alpha_param, n_arms, num_sims, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.alpha_param = alpha_param
+        self.n_arms = n_arms
+        self.num_sims = num_sims
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((self.num_sims, self.n_arms), dtype=int)
+        self.values = np.zeros((self.num_sims, self.n_arms))
+        self.r = np.zeros((self.num_sims, self.n_arms), dtype=int)
+        self.__current_arm = np.zeros(self.num_sims, dtype=int)
+        self.__next_update = np.zeros(self.num_sims, dtype=int)
+        self.alpha = np.ones((self.num_sims, self.n_arms))
+        self.beta = np.ones((self.num_sims, self.n_arms))
+
+    def __tau(self, r):
+        return np.ceil((1 + self.alpha_param) ** r)
+
+    def __bonus(self, n, r):
+        tau = self.__tau(r)
+        # the scalar version raises a math domain error once tau > e * n; clip to no bonus instead
+        with np.errstate(divide='ignore'):
+            bonus = np.sqrt(np.maximum((1. + self.alpha_param) * np.log(np.e * n / tau) / (2 * tau), 0))
+        return bonus
+
+    def __set_arms(self, sims, arms):
+        """
+        Same as UCB2.__set_arm, applied to every simulation in sims at once.
+        """
+        r = self.r[sims, arms]
+        self.__current_arm[sims] = arms
+        self.__next_update[sims] += np.maximum(1, self.__tau(r + 1) - self.__tau(r)).astype(int)
+        self.r[sims, arms] += 1
+
+    def select_arms(self):
+        sims = np.arange(self.num_sims)
+        total_counts = self.counts.sum(axis=1)
+        untried = self.counts == 0
+        has_untried = untried.any(axis=1)
+
+        ucb_values = self.values + self.__bonus(total_counts[:, None], self.r)
+        best = ucb_values == ucb_values.max(axis=1, keepdims=True)
+        chosen_arms = np.argmax(best * self.rng.random(best.shape), axis=1)
+
+        # play each arm once
+        chosen_arms = np.where(has_untried, np.argmax(untried, axis=1), chosen_arms)
+
+        # rows still inside an epoch keep playing their current arm
+        playing = ~has_untried & (self.__next_update > total_counts)
+        chosen_arms = np.where(playing, self.__current_arm, chosen_arms)
+        self.__set_arms(sims[~playing], chosen_arms[~playing])
+        return chosen_arms
+
+    def update(self, chosen_arms, rewards):
+        sims = np.arange(self.num_sims)
+        self.counts[sims, chosen_arms] += 1
+        self.alpha[sims, chosen_arms] += rewards
+        self.beta[sims, chosen_arms] += 1 - rewards
+        n = self.counts[sims, chosen_arms]
+        value = self.values[sims, chosen_arms]
+        self.values[sims, chosen_arms] = ((n - 1) / n) * value + (1 / n) * rewards
@@ -0,0 +1,240 @@
+"""
+Benchmarks for the algorithms and the simulation pipeline.
+
+    python benchmarks/benchmark.py --output baseline.json
+    python benchmarks/benchmark.py --output new.json --compare baseline.json
+
+For every algorithm class and number of arms it measures the latency of
+select_arm and update separately (p50/p99 in nanoseconds, one timer around
+each call) and the throughput of the plain select/update loop in decisions
+per second. The pipeline cases time run_sim, format_results and
+summarize_results end to end for each horizon, and the termination cases
+the cost of terminate=True over a plain run_sim of the same length. Everything is written as
+JSON; with --compare, every metric more than --threshold worse than in the
+baseline is reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'algorithms'), os.path.join(ROOT, 'simulation_framework')]
+
+from epsilon_greedy import EpsilonGreedy
+from epsilon_greedy_annealing import EpsilonGreedyAnnealing
+from softmax import Softmax
+from softmax_annealing import SoftmaxAnnealing
+from ucb1 import UCB1
+from ucb2 import UCB2
+from exp3 import EXP3
+from hedge import Hedge
+from thompson_sampling import ThompsonSampling, arm_of
+from bernoulli_trial import BernoulliTrial
+from simulation_framework import run_sim
+from plot_functions import format_results, summarize_results
+
+
+ALGORITHMS = {
+    'EpsilonGreedy': lambda n_arms, rng: EpsilonGreedy(.1, n_arms, rng=rng),
+    'EpsilonGreedyAnnealing': lambda n_arms, rng: EpsilonGreedyAnnealing(n_arms, rng=rng),
+    'Softmax': lambda n_arms, rng: Softmax(.1, n_arms, rng=rng),
+    'SoftmaxAnnealing': lambda n_arms, rng: SoftmaxAnnealing(n_arms, rng=rng),
+    'UCB1': lambda n_arms, rng: UCB1(n_arms, rng=rng),
+    'UCB2': lambda n_arms, rng: UCB2(.5, n_arms, rng=rng),
+    'EXP3': lambda n_arms, rng: EXP3(.1, n_arms, rng=rng),
+    'Hedge': lambda n_arms, rng: Hedge(1., n_arms, rng=rng),
+    'ThompsonSampling': lambda n_arms, rng: ThompsonSampling(n_arms, rng=rng),
+}
+
+# metrics where a larger value is an improvement; every other metric is a cost
+HIGHER_IS_BETTER = ('decisions_per_second',)
+
+
+def arm_probabilities(n_arms, rng):
+    return rng.uniform(.01, .2, n_arms)
+
+
+def bench_decisions(name, n_arms, decisions, warmup, seed=0):
+    """
+    Latency percentiles of select_arm and update, and throughput of the
+    select/update loop, over `decisions` decisions after `warmup` untimed ones.
+    """
+    rng = np.random.default_rng(seed)
+    p = arm_probabilities(n_arms, rng)
+    uniforms = rng.random(warmup + 2 * decisions)
+    algorithm = ALGORITHMS[name](n_arms, seed)
+    for i in range(warmup):
+        arm = arm_of(algorithm.select_arm())
+        algorithm.update(arm, int(uniforms[i] < p[arm]))
+    position = warmup
+
+    select_ns = np.empty(decisions, dtype=np.int64)
+    update_ns = np.empty(decisions, dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i in range(decisions):
+        start = clock()
+        choice = algorithm.select_arm()
+        middle = clock()
+        arm = arm_of(choice)
+        reward = int(uniforms[position + i] < p[arm])
+        before_update = clock()
+        algorithm.update(arm, reward)
+        end = clock()
+        select_ns[i] = middle - start
+        update_ns[i] = end - before_update
+    position += decisions
+
+    start = time.perf_counter()
+    for i in range(position, position + decisions):
+        arm = arm_of(algorithm.select_arm())
+        algorithm.update(arm, int(uniforms[i] < p[arm]))
+    elapsed = time.perf_counter() - start
+
+    return {'select_p50_ns': float(np.percentile(select_ns, 50)),
+            'select_p99_ns': float(np.percentile(select_ns, 99)),
+            'update_p50_ns': float(np.percentile(update_ns, 50)),
+            'update_p99_ns': float(np.percentile(update_ns, 99)),
+            'decisions_per_second': decisions / elapsed}
+
+
+def bench_pipeline(name, n_arms, horizon, num_sims, seed=0):
+    """
+    Seconds spent in run_sim, format_results and summarize_results for one sweep-sized run.
+    """
+    rng = np.random.default_rng(seed)
+    arms = [BernoulliTrial(p, rng=rng) for p in arm_probabilities(n_arms, rng)]
+    algorithm = ALGORITHMS[name](n_arms, seed)
+    start = time.perf_counter()
+    results = run_sim(algorithm, arms, horizon, num_sims)
+    simulated = time.perf_counter()
+    df = format_results(results, arms)
+    formatted = time.perf_counter()
+    summarize_results(df, arms, [])
+    summarized = time.perf_counter()
+    return {'run_sim_seconds': simulated - start,
+            'format_results_seconds': formatted - simulated,
+            'summarize_results_seconds': summarized - formatted,
+            'total_seconds': summarized - start}
+
+
+def bench_termination(name, n_arms, horizon, seed=0):
+    """
+    Seconds of run_sim with and without terminate=True. confidence=1 can never
+    be reached, so both runs play every trial and only the checks differ.
+    """
+    times = {}
+    for terminate in (False, True):
+        rng = np.random.default_rng(seed)
+        arms = [BernoulliTrial(p, rng=rng) for p in arm_probabilities(n_arms, rng)]
+        algorithm = ALGORITHMS[name](n_arms, seed)
+        start = time.perf_counter()
+        run_sim(algorithm, arms, horizon, terminate=terminate, confidence=1.)
+        times[terminate] = time.perf_counter() - start
+    return {'plain_seconds': times[False], 'terminate_seconds': times[True],
+            'terminate_ratio': times[True] / times[False]}
+
+
+def run_benchmarks(algorithms, n_arms_list, horizons, decisions, warmup, num_sims, pipeline_arms, max_seconds):
+    cases = {}
+    for name in algorithms:
+        for n_arms in n_arms_list:
+            start = time.perf_counter()
+            # very large arm counts make construction alone slow for some algorithms
+            metrics = bench_decisions(name, n_arms, decisions, min(warmup, 10 * n_arms))
+            metrics['seconds'] = time.perf_counter() - start
+            cases['decisions/{}/n_arms={}'.format(name, n_arms)] = metrics
+            report('decisions/{}/n_arms={}'.format(name, n_arms), metrics)
+            if metrics['seconds'] > max_seconds:
+                # larger arm counts would only take longer
+                break
+        for horizon in horizons:
+            metrics = bench_pipeline(name, pipeline_arms, horizon, num_sims)
+            cases['pipeline/{}/horizon={}'.format(name, horizon)] = metrics
+            report('pipeline/{}/horizon={}'.format(name, horizon), metrics)
+            metrics = bench_termination(name, pipeline_arms, horizon)
+            cases['termination/{}/horizon={}'.format(name, horizon)] = metrics
+            report('termination/{}/horizon={}'.format(name, horizon), metrics)
+    return cases
+
+
+def report(case, metrics):
+    print('{:<50} {}'.format(case, '  '.join('{}={:.4g}'.format(key, value) for key, value in metrics.items())))
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'commit': commit or None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(cases, baseline, threshold):
+    """
+    Lists every metric of a case present in both runs which is more than
+    threshold (relative) worse than in the baseline.
+    """
+    regressions = []
+    for case, metrics in cases.items():
+        for metric, value in metrics.items():
+            old = baseline.get(case, {}).get(metric)
+            if old is None or metric == 'seconds' or old <= 0 or value <= 0:
+                continue
+            change = old / value - 1 if metric in HIGHER_IS_BETTER else value / old - 1
+            if change > threshold:
+                regressions.append({'case': case, 'metric': metric, 'baseline': old, 'value': value,
+                                    'slowdown': change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--algorithms', nargs='+', default=list(ALGORITHMS), choices=list(ALGORITHMS))
+    parser.add_argument('--n-arms', nargs='+', type=int, default=[2, 10, 100, 1000, 10000, 100000])
+    parser.add_argument('--horizons', nargs='+', type=int, default=[1000, 10000])
+    parser.add_argument('--decisions', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=1000)
+    parser.add_argument('--num-sims', type=int, default=10)
+    parser.add_argument('--pipeline-arms', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=30.,
+                        help='skip the larger arm counts of an algorithm once one case takes this long')
+    parser.add_argument('--quick', action='store_true', help='small sizes, for checking the harness itself')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='baseline JSON file to check the results against')
+    parser.add_argument('--threshold', type=float, default=.2,
+                        help='relative slowdown reported as a regression (default .2, i.e. 20%%)')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.n_arms, args.horizons, args.decisions, args.warmup, args.num_sims = [2, 100], [500], 200, 100, 2
+
+    cases = run_benchmarks(args.algorithms, args.n_arms, args.horizons, args.decisions, args.warmup,
+                           args.num_sims, args.pipeline_arms, args.max_seconds)
+    output = {'environment': environment(), 'cases': cases}
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(cases, baseline['cases'], args.threshold)
+        output['regressions'] = regressions
+        for regression in regressions:
+            print('REGRESSION {case} {metric}: {baseline:.4g} -> {value:.4g} ({slowdown:+.0%})'.format(**regression))
+        if not regressions:
+            print('no regressions against {}'.format(args.compare))
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import asyncio
+import time
+import numpy as np
+from random_stream import RandomStream
+from state_snapshot import copy_state
+from thompson_sampling import arm_of
+
+
+class BanditServer():
+    """
+    asyncio front end to any algorithm in algorithms/.
+
+    Decisions are made on a published snapshot, a private copy of the
+    algorithm which is never updated, so select_arm never waits for, or
+    interleaves with, feedback being applied. Rewards are queued, and a
+    single writer task applies them to the master copy in micro-batches
+    of up to batch_size through update_batch. A publisher task swaps in a
+    fresh snapshot every publish_interval seconds once there is new
+    feedback (and immediately after publish_every updates, if given).
+    Replacing the snapshot is a single reference assignment.
+
+    All snapshots draw from the server's own random stream rather than a
+    copy of the master's, so no draw is ever repeated. State the algorithm
+    changes while selecting (UCB2's epochs, the play-each-arm-once phase
+    of UCB1 and UCB2) lives in the snapshot and is rebuilt from the master
+    at every publish.
+
+    If update_batch raises, the writer drops that batch, counts it in
+    updates_failed and carries on; the exception is re-raised by the next
+    flush() or stop().
+
+    Use as `async with BanditServer(algorithm) as server:`, or call start()
+    and stop(). handle() is the transport-agnostic request handler a web
+    route would call; LocalClient drives it in process.
+    """
+    def __init__(self, algorithm, batch_size=256, publish_interval=.05, publish_every=None, max_queue=0, rng=None):
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self.publish_interval = publish_interval
+        self.publish_every = publish_every
+        self.max_queue = max_queue
+        self.rng = RandomStream(rng)
+        self.version = 0
+        self.decisions = 0
+        self.updates_applied = 0
+        self.updates_failed = 0
+        self.error = None
+        self.updates_since_publish = 0
+        self.published_at = time.monotonic()
+        self.snapshot = None
+        self.queue = None
+        self.tasks = []
+        self.publish()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.max_queue)
+        self.tasks = [asyncio.create_task(self.__write()), asyncio.create_task(self.__publish_periodically())]
+
+    async def stop(self):
+        """
+        Applies and publishes all queued feedback, then stops the background tasks.
+        """
+        try:
+            await self.flush()
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            self.tasks = []
+
+    def publish(self):
+        snapshot = copy_state(self.algorithm)
+        snapshot.rng = self.rng
+        self.snapshot = snapshot
+        self.version += 1
+        self.updates_since_publish = 0
+        self.published_at = time.monotonic()
+
+    def select_arm(self):
+        """
+        Chooses an arm from the current snapshot. Never awaits, so it cannot
+        interleave with other requests or with the writer.
+        """
+        chosen_arm = arm_of(self.snapshot.select_arm())
+        self.decisions += 1
+        return chosen_arm
+
+    def select_arms(self, k):
+        arms = self.snapshot.select_arms(k)
+        self.decisions += k
+        return arms
+
+    async def update(self, chosen_arm, reward):
+        """
+        Queues one reward; it is applied by the writer with the next micro-batch.
+        Only waits when the queue is bounded (max_queue) and full.
+        """
+        feedback = self.__feedback(chosen_arm, reward)
+        await self.queue.put(feedback)
+
+    def update_nowait(self, chosen_arm, reward):
+        feedback = self.__feedback(chosen_arm, reward)
+        self.queue.put_nowait(feedback)
+
+    def __feedback(self, chosen_arm, reward):
+        if self.queue is None:
+            raise RuntimeError('server not started; call start() or use `async with` before sending updates')
+        # checked here, so a bad request fails alone rather than taking the writer's batch down with it
+        chosen_arm = int(chosen_arm)
+        if not 0 <= chosen_arm < self.algorithm.n_arms:
+            raise ValueError('arm must be in [0, {}), got {}'.format(self.algorithm.n_arms, chosen_arm))
+        return chosen_arm, float(reward)
+
+    async def flush(self):
+        """
+        Waits until everything queued so far is applied, then publishes it.
+        Raises the last exception of a failed micro-batch since the previous flush.
+        """
+        if self.queue is not None:
+            await self.queue.join()
+        if self.updates_since_publish:
+            self.publish()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    async def handle(self, request):
+        """
+        Serves one request dict: {'op': 'select'} or {'op': 'select', 'k': k};
+        {'op': 'update', 'arm': arm, 'reward': reward}; {'op': 'stats'}.
+        """
+        op = request.get('op')
+        if op == 'select':
+            if 'k' in request:
+                return {'arms': self.select_arms(int(request['k'])).tolist(), 'version': self.version}
+            return {'arm': self.select_arm(), 'version': self.version}
+        if op == 'update':
+            await self.update(request['arm'], request['reward'])
+            return {'queued': self.queue.qsize()}
+        if op == 'stats':
+            return self.stats()
+        raise ValueError("op must be 'select', 'update' or 'stats', got {}".format(op))
+
+    def stats(self):
+        return {'version': self.version, 'decisions': self.decisions, 'updates_applied': self.updates_applied,
+                'updates_failed': self.updates_failed,
+                'queued': self.queue.qsize() if self.queue is not None else 0,
+                'snapshot_age': time.monotonic() - self.published_at}
+
+    async def __write(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                chosen_arms = np.fromiter((arm for arm, reward in batch), dtype=np.int64, count=len(batch))
+                rewards = np.fromiter((reward for arm, reward in batch), dtype=float, count=len(batch))
+                self.algorithm.update_batch(chosen_arms, rewards)
+            except Exception as error:
+                # kept for flush() to raise; the writer has to live on or every later update is lost
+                self.error = error
+                self.updates_failed += len(batch)
+            else:
+                self.updates_applied += len(batch)
+                self.updates_since_publish += len(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if self.publish_every is not None and self.updates_since_publish >= self.publish_every:
+                self.publish()
+            # let requests in between micro-batches
+            await asyncio.sleep(0)
+
+    async def __publish_periodically(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            if self.updates_since_publish:
+                self.publish()
+
+
+class LocalClient():
+    """
+    In-process client for a BanditServer, making the same request dicts a
+    web handler would pass to BanditServer.handle. Every request yields to
+    the event loop once, as the network round trip would, so concurrent
+    clients interleave with each other and with the writer.
+    """
+    def __init__(self, server):
+        self.server = server
+
+    async def request(self, request):
+        await asyncio.sleep(0)
+        return await self.server.handle(request)
+
+    async def select_arm(self):
+        return (await self.request({'op': 'select'}))['arm']
+
+    async def select_arms(self, k):
+        return (await self.request({'op': 'select', 'k': k}))['arms']
+
+    async def update(self, arm, reward):
+        return await self.request({'op': 'update', 'arm': arm, 'reward': reward})
+
+    async def stats(self):
+        return await self.request({'op': 'stats'})
@@ -0,0 +1,167 @@
+import os
+from multiprocessing import Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from bandit_registry import BanditRegistry
+
+
+def serve_shard(connection, memory_name, n_tenants, n_arms, policy, epsilon, seed):
+    """
+    Worker loop of one shard: applies the requests sent by ShardedRegistry, in order, to its registry.
+    """
+    memory = SharedMemory(memory_name)
+    registry = BanditRegistry(n_tenants, n_arms, policy, epsilon, rng=seed, buffer=memory.buf)
+    try:
+        while True:
+            request = connection.recv()
+            op = request[0]
+            if op == 'select':
+                connection.send(registry.select_arms(request[1]))
+            elif op == 'update':
+                registry.update(*request[1:])
+            elif op == 'reset':
+                registry.reset(request[1])
+            elif op == 'sync':
+                connection.send(True)
+            elif op == 'close':
+                break
+    finally:
+        del registry
+        memory.close()
+
+
+class ShardedRegistry():
+    """
+    A BanditRegistry split across n_shards worker processes (one per CPU by
+    default), so selects and updates for different tenants run in parallel.
+
+    Tenant t lives in shard t % n_shards as its local tenant t // n_shards,
+    which spreads consecutive ids evenly. Each call splits its tenant ids
+    by shard, sends every shard its part at once and gathers the replies,
+    so a call costs one round trip however many tenants it covers. Only
+    the owning worker writes a shard; its state is in shared memory, which
+    counts() and values() read directly after a flush(). Requests to a
+    shard are applied in the order they were made, so a select always sees
+    the updates sent before it.
+
+    Use as `with ShardedRegistry(...) as registry:`, or call close().
+    """
+    def __init__(self, n_tenants, n_arms, n_shards=None, policy='thompson', epsilon=.1, rng=None):
+        self.n_tenants = n_tenants
+        self.n_arms = n_arms
+        self.n_shards = n_shards or os.cpu_count()
+        seeds = np.random.default_rng(rng).integers(2 ** 63, size=self.n_shards)
+        self.memories = []
+        self.connections = []
+        self.processes = []
+        # read-only views of each shard's state for the parent
+        self.registries = []
+        for shard in range(self.n_shards):
+            shard_tenants = len(range(shard, n_tenants, self.n_shards))
+            memory = SharedMemory(create=True, size=max(1, BanditRegistry.state_bytes(shard_tenants, n_arms)))
+            np.ndarray(memory.size, dtype=np.uint8, buffer=memory.buf)[:] = 0
+            connection, worker_connection = Pipe()
+            process = Process(target=serve_shard, daemon=True,
+                              args=(worker_connection, memory.name, shard_tenants, n_arms, policy, epsilon,
+                                    seeds[shard]))
+            process.start()
+            worker_connection.close()
+            self.memories.append(memory)
+            self.connections.append(connection)
+            self.processes.append(process)
+            self.registries.append(BanditRegistry(shard_tenants, n_arms, policy, epsilon, buffer=memory.buf))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def nbytes(self):
+        return sum(registry.state.nbytes for registry in self.registries)
+
+    def __split(self, tenants):
+        """
+        Yields (shard, positions in tenants, local tenant ids) for every shard
+        that has tenants. Tenant arrays are flattened, so positions index
+        tenants.ravel().
+        """
+        tenants = np.ravel(tenants)
+        shards = tenants % self.n_shards
+        order = np.argsort(shards, kind='stable')
+        bounds = np.searchsorted(shards[order], np.arange(self.n_shards + 1))
+        for shard in range(self.n_shards):
+            if bounds[shard] < bounds[shard + 1]:
+                positions = order[bounds[shard]:bounds[shard + 1]]
+                yield shard, positions, tenants[positions] // self.n_shards
+
+    def select_arms(self, tenants):
+        """
+        One arm for each entry of tenants, returned in the shape of tenants
+        (a single arm for a scalar tenant).
+        """
+        parts = []
+        for shard, positions, local in self.__split(tenants):
+            self.connections[shard].send(('select', local))
+            parts.append((shard, positions))
+        chosen_arms = np.empty(np.size(tenants), dtype=np.int64)
+        for shard, positions in parts:
+            chosen_arms[positions] = self.connections[shard].recv()
+        return chosen_arms.reshape(np.shape(tenants))
+
+    def update(self, tenants, chosen_arms, rewards):
+        """
+        Sends one reward per (tenant, arm) pair to the owning shards without
+        waiting for them to be applied.
+        """
+        chosen_arms = np.ravel(chosen_arms)
+        rewards = np.broadcast_to(np.ravel(np.asarray(rewards, dtype=np.float32)), chosen_arms.shape)
+        for shard, positions, local in self.__split(tenants):
+            self.connections[shard].send(('update', local, chosen_arms[positions], rewards[positions]))
+
+    def reset(self, tenants=None):
+        if tenants is None:
+            for connection in self.connections:
+                connection.send(('reset', None))
+        else:
+            for shard, positions, local in self.__split(tenants):
+                self.connections[shard].send(('reset', local))
+
+    def flush(self):
+        """
+        Waits until every shard has applied all requests sent so far.
+        """
+        for connection in self.connections:
+            connection.send(('sync',))
+        for connection in self.connections:
+            connection.recv()
+
+    def __gather(self, tenants, read):
+        tenants = np.asarray(tenants)
+        self.flush()
+        result = np.empty((tenants.size, self.n_arms), dtype=np.float32)
+        for shard, positions, local in self.__split(tenants):
+            result[positions] = read(self.registries[shard], local)
+        return result.reshape(tenants.shape + (self.n_arms,))
+
+    def counts(self, tenants):
+        return self.__gather(tenants, lambda registry, local: registry.counts[local])
+
+    def values(self, tenants):
+        return self.__gather(tenants, BanditRegistry.values)
+
+    def close(self):
+        for connection, process in zip(self.connections, self.processes):
+            if process.is_alive():
+                connection.send(('close',))
+            process.join()
+            connection.close()
+        # the parent's views must go before the shared memory can be closed
+        self.registries = []
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories = []
+        self.connections = []
+        self.processes = []
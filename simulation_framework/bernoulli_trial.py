@@ -1,12 +1,19 @@
-import random
+from random_stream import RandomStream
 
 
 class BernoulliTrial():
-    def __init__(self, p):
+    def __init__(self, p, rng=None):
         self.p = p
-        
+        self.seed(rng)
+
+    def seed(self, rng=None):
+        self.rng = RandomStream(rng)
+
     def draw(self):
-        if random.random() > self.p:
+        if self.rng.random() > self.p:
             return 0
         else:
             return 1
+
+    def draw_batch(self, size):
+        return (self.rng.generator.random(size) <= self.p).astype(int)
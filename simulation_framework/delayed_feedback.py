@@ -0,0 +1,74 @@
+import numpy as np
+from simulation_framework import new_recorder, expected_rewards
+from pending_ledger import PendingLedger
+
+
+def constant_delay(trials):
+    return lambda rng, size: np.full(size, trials, dtype=np.int64)
+
+
+def geometric_delay(mean):
+    """
+    Memoryless delays, in trials, averaging mean.
+    """
+    return lambda rng, size: rng.geometric(1 / (mean + 1), size) - 1
+
+
+def lognormal_delay(median, sigma=1.):
+    """
+    Heavy-tailed delays, in trials, as conversions minutes to hours after the decision are.
+    """
+    return lambda rng, size: np.floor(rng.lognormal(np.log(median), sigma, size)).astype(np.int64)
+
+
+def run_sim_delayed(algorithm, arms, horizon, num_sims=1, delay=0, update_interval=1, checkpoints=None,
+                    aggregate=False, variance=False, recorder=None, rng=None, track_regret=False, ledger=None):
+    """
+    run_sim with feedback that arrives late. The reward of the decision made
+    at trial t is drawn right away (it is what the recorder sees), but only
+    reaches the algorithm once delay trials have passed, through a
+    PendingLedger matching it to its decision id. delay is a number of
+    trials, or a function (rng, size) -> delays such as geometric_delay or
+    lognormal_delay, so rewards can arrive out of order. Everything that
+    has arrived is applied in one update_batch every update_interval trials.
+    delay=0 with update_interval=1 plays the same game as run_sim.
+
+    Delays are drawn from rng, or from the algorithm's own generator if
+    None. Rewards still pending at the horizon are never applied.
+    Early termination is not supported. Like a recorder, a PendingLedger
+    over the algorithm can be passed in to inspect it afterwards, e.g.
+    max_pending for how far the updates of the last simulation lagged.
+    """
+    if recorder is None:
+        results = new_recorder(num_sims, horizon, len(arms), checkpoints, aggregate, variance,
+                               expected_rewards(arms) if track_regret else None)
+    else:
+        results = recorder
+    sample_delays = constant_delay(delay) if np.isscalar(delay) else delay
+    rng = algorithm.rng.generator if rng is None else np.random.default_rng(rng)
+    if ledger is None:
+        ledger = PendingLedger(algorithm)
+
+    for sim in range(num_sims):
+        algorithm.reset()
+        ledger.reset()
+        # the reward of decision t becomes available at the start of trial arrival[t]
+        arrival = np.arange(horizon) + 1 + np.asarray(sample_delays(rng, horizon), dtype=np.int64)
+        order = np.argsort(arrival, kind='stable')
+        sorted_arrival = arrival[order]
+        rewards = np.zeros(horizon)
+        delivered = 0
+        cumulative_reward = 0
+        for t in range(horizon):
+            if t % update_interval == 0:
+                due = np.searchsorted(sorted_arrival, t, side='right')
+                if due > delivered:
+                    decision_ids = order[delivered:due]
+                    ledger.record_rewards(decision_ids, rewards[decision_ids])
+                    delivered = due
+            decision_id, chosen_arm = ledger.select_arm(t)
+            reward = arms[chosen_arm].draw()
+            rewards[decision_id] = reward
+            cumulative_reward += reward
+            results.record(sim, t, chosen_arm, reward, cumulative_reward, algorithm.alpha, algorithm.beta)
+    return results.finalize()
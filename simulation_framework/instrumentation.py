@@ -0,0 +1,116 @@
+import json
+import sys
+try:
+    import resource
+except ImportError:
+    # not available on Windows; the memory high-water mark is then left out
+    resource = None
+
+
+class Instrumentation():
+    """
+    Metrics sink for run_sim and run_sim_vectorized. Passing one switches
+    them to an instrumented copy of their trial loop, which times every
+    phase with perf_counter_ns. Without one, the plain loop runs and
+    nothing is measured at all.
+
+    Kept per phase: total nanoseconds, number of calls and the slowest
+    call. The run_sim phases are select_arm, stopping_check, draw, record
+    and update; run_sim_vectorized has select_arms, draw, record and
+    update. Counters cover decisions, simulations and early terminations.
+    The peak resident set size of the process is sampled at the end of
+    every simulation.
+
+    Subclasses can hook simulation_started / simulation_ended, e.g. to
+    stream metrics elsewhere; labels are added to every exported sample.
+    """
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.reset()
+
+    def reset(self):
+        self.phase_ns = {}
+        self.phase_calls = {}
+        self.phase_max_ns = {}
+        self.decisions = 0
+        self.simulations = 0
+        self.early_terminations = 0
+        self.peak_rss_bytes = None
+
+    def add(self, phase, ns, calls=1, max_ns=None):
+        """
+        Adds calls timed calls of phase totalling ns nanoseconds, the slowest taking max_ns (ns by default).
+        """
+        max_ns = ns if max_ns is None else max_ns
+        if phase in self.phase_ns:
+            self.phase_ns[phase] += ns
+            self.phase_calls[phase] += calls
+            self.phase_max_ns[phase] = max(self.phase_max_ns[phase], max_ns)
+        else:
+            self.phase_ns[phase] = ns
+            self.phase_calls[phase] = calls
+            self.phase_max_ns[phase] = max_ns
+
+    def simulation_started(self, sim):
+        pass
+
+    def simulation_ended(self, sim, trials, stopped):
+        self.simulations += 1
+        self.decisions += trials
+        self.early_terminations += stopped
+        self.sample_memory()
+
+    def sample_memory(self):
+        if resource is None:
+            return
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+        self.peak_rss_bytes = peak if self.peak_rss_bytes is None else max(self.peak_rss_bytes, peak)
+
+    def to_dict(self):
+        return {'labels': self.labels,
+                'phases': {phase: {'ns': self.phase_ns[phase], 'calls': self.phase_calls[phase],
+                                   'max_ns': self.phase_max_ns[phase]} for phase in self.phase_ns},
+                'decisions': self.decisions,
+                'simulations': self.simulations,
+                'early_terminations': self.early_terminations,
+                'peak_rss_bytes': self.peak_rss_bytes}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def prometheus(self, prefix='bandit'):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+            for labels, value in samples:
+                labels = dict(self.labels, **labels)
+                label_text = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                                      for key, value in sorted(labels.items()))
+                lines.append('{}_{}{} {}'.format(prefix, name, '{' + label_text + '}' if label_text else '', value))
+
+        metric('phase_seconds_total', 'counter', 'Time spent in each run_sim phase.',
+               [({'phase': phase}, ns / 1e9) for phase, ns in self.phase_ns.items()])
+        metric('phase_calls_total', 'counter', 'Number of timed calls of each run_sim phase.',
+               [({'phase': phase}, calls) for phase, calls in self.phase_calls.items()])
+        metric('phase_max_seconds', 'gauge', 'Slowest single call of each run_sim phase.',
+               [({'phase': phase}, ns / 1e9) for phase, ns in self.phase_max_ns.items()])
+        metric('decisions_total', 'counter', 'Arms played.', [({}, self.decisions)])
+        metric('simulations_total', 'counter', 'Simulations run.', [({}, self.simulations)])
+        metric('early_terminations_total', 'counter', 'Simulations ended by their stopping policy.',
+               [({}, self.early_terminations)])
+        if self.peak_rss_bytes is not None:
+            metric('peak_rss_bytes', 'gauge', 'Peak resident set size of the process.',
+                   [({}, self.peak_rss_bytes)])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, prefix='bandit'):
+        with open(path, 'w') as f:
+            f.write(self.prometheus(prefix))
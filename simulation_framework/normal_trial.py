@@ -1,10 +1,17 @@
-import random
+from random_stream import RandomStream
 
 
 class NormalTrial():
-    def __init__(self, mu, sigma):
+    def __init__(self, mu, sigma, rng=None):
         self.mu = mu
         self.sigma = sigma
-  
+        self.seed(rng)
+
+    def seed(self, rng=None):
+        self.rng = RandomStream(rng)
+
     def draw(self):
-        return random.gauss(self.mu, self.sigma)
+        return self.rng.gauss(self.mu, self.sigma)
+
+    def draw_batch(self, size):
+        return self.rng.generator.normal(self.mu, self.sigma, size)
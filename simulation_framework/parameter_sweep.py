@@ -0,0 +1,100 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from simulation_framework import run_sim, run_sim_vectorized, expected_rewards
+from plot_functions import format_results
+from streaming_summary import StreamingSummary
+from result_store import write_chunk
+
+
+def run_sweep(algorithm_class, hyperparameter, values, arms, horizon, num_sims=1, seed=None, processes=None,
+              chunk_size=None, vectorized=False, aggregate=False, variance=False, store=None, **kwargs):
+    """
+    Runs num_sims simulations of algorithm_class for every value of one of its
+    hyperparameters (e.g. EpsilonGreedy and 'epsilon'), fanning
+    (value, chunk of simulations) jobs out over a process pool.
+
+    Each job seeds the algorithm and the arms from its own child of
+    np.random.SeedSequence(seed), so a sweep with a fixed seed and chunk_size
+    gives the same results whatever the number of processes or the order the
+    jobs finish in. By default each value is split into up to 64 chunks.
+
+    Returns the per-trial results with a `hyperparameter` column, ready for
+    summarize_results(df, arms, [hyperparameter]); with aggregate=True the
+    workers only ship running means back and the df_ave frame is returned.
+    Any other keyword arguments are passed on to run_sim.
+
+    Given a ResultStore, every chunk is saved as soon as it completes and
+    chunks already in the store are not run again, so with a fixed seed an
+    interrupted sweep picks up where it stopped. The StoredRun is returned
+    instead of the per-trial frame (summarize_results reads it chunk by
+    chunk); with aggregate=True it is still df_ave.
+    """
+    processes = processes or os.cpu_count()
+    if chunk_size is None:
+        # not tied to processes, so the seeds don't change with the machine
+        chunk_size = max(1, math.ceil(num_sims / 64))
+    chunks = [(start, min(chunk_size, num_sims - start)) for start in range(0, num_sims, chunk_size)]
+    seed_sequence = np.random.SeedSequence(seed)
+    seeds = seed_sequence.spawn(len(values) * len(chunks))
+    run = None
+    if store is not None:
+        run = store.run(algorithm_class.__name__, hyperparameter, values, arms, horizon, num_sims,
+                        seed_sequence.entropy, chunk_size, vectorized=vectorized, aggregate=aggregate,
+                        variance=variance, **kwargs)
+
+    jobs = []
+    for i, value in enumerate(values):
+        for j, (start, size) in enumerate(chunks):
+            if run is not None and run.has_chunk(i, start):
+                continue
+            path = None if run is None else run.chunk_path(i, start)
+            jobs.append((algorithm_class, hyperparameter, value, arms, horizon, start, size,
+                         seeds[i * len(chunks) + j], vectorized, aggregate, variance, kwargs, path))
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        outputs = list(executor.map(run_chunk, jobs))
+
+    if run is not None:
+        if not aggregate:
+            return run
+        outputs = [run.read_summary(i, start) for i in range(len(values)) for start, size in chunks]
+
+    frames = []
+    for i, value in enumerate(values):
+        chunk_outputs = outputs[i * len(chunks):(i + 1) * len(chunks)]
+        if aggregate:
+            summary = chunk_outputs[0]
+            for other in chunk_outputs[1:]:
+                summary.combine(other)
+            df = summary.finalize()
+        else:
+            df = pd.concat(chunk_outputs, ignore_index=True)
+        df.insert(0, hyperparameter, value)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_chunk(job):
+    algorithm_class, hyperparameter, value, arms, horizon, start, size, seed, vectorized, aggregate, variance, kwargs, path = job
+    rng = np.random.default_rng(seed)
+    for arm in arms:
+        arm.seed(rng)
+
+    algorithm = algorithm_class(**{hyperparameter: value, 'n_arms': len(arms)}, rng=rng)
+    simulate = run_sim_vectorized if vectorized else run_sim
+    if aggregate:
+        summary = StreamingSummary(horizon, len(arms), variance,
+                                   expected_rewards(arms) if kwargs.get('track_regret') else None)
+        simulate(algorithm, arms, horizon, size, recorder=summary, **kwargs)
+        result = summary
+    else:
+        result = format_results(simulate(algorithm, arms, horizon, size, **kwargs), arms)
+        result['sim_num'] += start
+    if path is not None:
+        # written by the worker, so nothing needs shipping back
+        write_chunk(path, result)
+        return None
+    return result
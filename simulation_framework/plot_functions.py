@@ -8,20 +8,40 @@ from IPython.display import Image
 import re
 from scipy import stats
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image as PILImage
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from result_store import StoredRun
 
 
-def format_results(results, arms):
-    df = pd.DataFrame(list(zip(*results)), columns=['sim_num', 'trial', 'chosen_arm', 'reward', 'cumulative_reward', 'alphas', 'betas'])
-    alphas = pd.DataFrame(df['alphas'].values.tolist(), columns=['alpha_{}'.format(arm) for arm in range(len(df['alphas'].iloc[0]))])
-    betas = pd.DataFrame(df['betas'].values.tolist(), columns=['beta_{}'.format(arm) for arm in range(len(df['betas'].iloc[0]))])
+def format_results(results, arms, per_arm_columns=None):
+    """
+    The per-trial frame of run_sim's results. per_arm_columns adds a one-hot
+    arm_<i> and a running arm_<i>_cumulative column for every arm; by default
+    only when the results have no regret columns, since their optimal column
+    already gives the accuracy.
+    """
+    columns = results.columns()
+    regret_columns = results.regret_columns()
+    columns.update(regret_columns)
+    columns.update(results.alpha_beta_columns())
+    if per_arm_columns is None:
+        per_arm_columns = not regret_columns
+    if not per_arm_columns:
+        return pd.DataFrame(columns, copy=False)
+    # one row per arm, so every arm's column is a contiguous view
+    chosen = np.zeros((len(arms), len(results)), dtype=np.int64)
+    chosen[results.chosen_arm, np.arange(len(results))] = 1
+    cumulative = np.cumsum(chosen, axis=1)
+    # restart the running counts at every simulation's first row
+    starts = np.concatenate((np.zeros((len(arms), 1), dtype=np.int64), cumulative), axis=1)[:, results.sim_offsets()]
+    cumulative -= np.repeat(starts, results.lengths, axis=1)
     for arm in range(len(arms)):
-        df['arm_{}'.format(arm)] = (df['chosen_arm'] == arm).astype(int)
-        df['arm_{}_cumulative'.format(arm)] = df.groupby((df.sim_num !=
-                                                          df.sim_num.shift())
-                                                          .cumsum())['arm_{}'.format(arm)].cumsum()
-        df['alpha_{}'.format(arm)] = alphas['alpha_{}'.format(arm)]
-        df['beta_{}'.format(arm)] = betas['beta_{}'.format(arm)]
-    return df
+        columns['arm_{}'.format(arm)] = chosen[arm]
+        columns['arm_{}_cumulative'.format(arm)] = cumulative[arm]
+    return pd.DataFrame(columns, copy=False)
 
 
 def summarize_results(results_df, arms, hyperparameter_list):
@@ -30,17 +50,42 @@ def summarize_results(results_df, arms, hyperparameter_list):
     agg_list = ['reward', 'cumulative_reward']
     agg_list.extend(arm_list)
     agg_list.extend(alpha_beta)
+    agg_list.extend(['regret', 'pseudo_regret', 'optimal'])
     hyperparameter_list.append('trial')
+    if isinstance(results_df, StoredRun):
+        return summarize_chunks(results_df.chunks(hyperparameter_list + agg_list), hyperparameter_list, agg_list)
+    # the per-arm and regret columns are each only there for some runs
+    agg_list = [column for column in agg_list if column in results_df]
     df_ave = results_df.groupby(hyperparameter_list)[agg_list].mean().reset_index()
     return df_ave
 
 
+def summarize_chunks(chunks, keys, agg_list):
+    """
+    Group means of agg_list over an iterable of frames, holding only one
+    frame and the per-group sums and counts in memory at a time.
+    """
+    sums, counts = None, None
+    for df in chunks:
+        grouped = df.groupby(keys)[[column for column in agg_list if column in df]]
+        chunk_sums, chunk_counts = grouped.sum(), grouped.count()
+        sums = chunk_sums if sums is None else sums.add(chunk_sums, fill_value=0)
+        counts = chunk_counts if counts is None else counts.add(chunk_counts, fill_value=0)
+    return (sums / counts).reset_index()
+
+
+def accuracy_column(df_ave, probabilities):
+    # optimal when regret was tracked, otherwise the best arm's one-hot column
+    return 'optimal' if 'optimal' in df_ave else 'arm_{}'.format(np.argmax(probabilities))
+
+
 def plot_accuracy(df_ave, probabilities, algorithm_name, hyperparameter=None):
+    accuracy = accuracy_column(df_ave, probabilities)
     if hyperparameter:
         plt.figure(figsize=(10, 7))
         for parameter in df_ave[hyperparameter].unique():
             plt.plot(df_ave[df_ave[hyperparameter] == parameter]['trial'],
-                     df_ave[df_ave[hyperparameter] == parameter]['arm_{}'.format(np.argmax(probabilities))],
+                     df_ave[df_ave[hyperparameter] == parameter][accuracy],
                      label=parameter)
         plt.legend(title=hyperparameter)
         plt.xlabel('Number of Trials')
@@ -50,7 +95,7 @@ def plot_accuracy(df_ave, probabilities, algorithm_name, hyperparameter=None):
     else:
         plt.figure(figsize=(10, 7))
         plt.plot(df_ave['trial'],
-                 df_ave['arm_{}'.format(np.argmax(probabilities))])
+                 df_ave[accuracy])
         plt.xlabel('Number of Trials')
         plt.ylabel('Probability of Selecting Best Arm')
         plt.title('Accuracy of the {} Algorithm'.format(algorithm_name))
@@ -135,15 +180,31 @@ def plot_expected_reward(arm_results, arms, algorithm, xlim=None, ylim=None):
     plt.show()
 
 
+T_QUANTILES = {}
+
+
 def lookup_t(dof, alpha=.025):
-    return stats.t.ppf(1 - alpha, dof)
+    """
+    Upper alpha quantile of Student's t for a single dof or an array of them.
+    Integer dofs are served from a table per alpha, computed with one
+    vectorized t.ppf call and extended as larger dofs are asked for.
+    """
+    dofs = np.asarray(dof)
+    if dofs.size == 0 or not np.issubdtype(dofs.dtype, np.integer) or dofs.min() < 0:
+        return stats.t.ppf(1 - alpha, dof)
+    table = T_QUANTILES.get(alpha)
+    if table is None or len(table) <= dofs.max():
+        size = max(dofs.max() + 1, 2 * len(table) if table is not None else 0)
+        table = stats.t.ppf(1 - alpha, np.arange(size))
+        T_QUANTILES[alpha] = table
+    return table[dofs] if dofs.ndim else table[dofs].item()
 
 
 def build_confidence_interval(df, confidence_level=.95):
     confidence_level = confidence_level
     alpha = (1 - confidence_level) / 2
-    df['dof'] = df.reset_index().index
-    df['t_stat'] = df['dof'].apply(lookup_t, args=(alpha,))
+    df['dof'] = np.arange(len(df))
+    df['t_stat'] = lookup_t(df['dof'].values, alpha)
     df['std'] = df['reward'].expanding(2).std()
     df['mean'] = df['reward'].expanding(2).mean()
     df['confidence_interval'] = df['t_stat'] * df['std'] / np.sqrt(df['dof'] + 1)
@@ -153,20 +214,64 @@ def build_confidence_interval(df, confidence_level=.95):
 
 
 def create_arm_results(df, arms, confidence_level):
+    # one groupby over (arm, trial) instead of filtering the frame once per arm
+    means = df.groupby(['chosen_arm', 'trial'])[['reward', 'cumulative_reward']].mean()
+    played = set(means.index.get_level_values('chosen_arm'))
     arm_results = {}
     for arm in range(len(arms)):
-        arm_results[arm] = build_confidence_interval(df[df['arm_{}'.format(arm)] == 1]. \
-                                                     groupby('trial')[['reward', 'cumulative_reward']]. \
-                                                     mean(), confidence_level)
+        if arm in played:
+            arm_means = means.xs(arm, level='chosen_arm').copy()
+        else:
+            arm_means = means.iloc[:0].droplevel('chosen_arm')
+        arm_results[arm] = build_confidence_interval(arm_means, confidence_level)
     return arm_results
 
 
+BETA_GRID = np.arange(0, 1.001, 0.001)
+BETA_PDFS = {}
+BETA_PDF_CACHE_SIZE = 10000
+
+
+def beta_parameters(df_ave, indices, n_arms):
+    """
+    Alpha and beta of every arm at the given rows of df_ave, as two
+    (len(indices), n_arms) arrays.
+    """
+    alphas = df_ave[['alpha_{}'.format(arm) for arm in range(n_arms)]].values[indices]
+    betas = df_ave[['beta_{}'.format(arm) for arm in range(n_arms)]].values[indices]
+    return alphas, betas
+
+
+def beta_pdfs(alphas, betas):
+    """
+    Beta densities on BETA_GRID for alpha/beta arrays of any matching shape,
+    returned with the grid as a trailing axis. Each distinct (alpha, beta)
+    pair is evaluated once, by a single broadcasted beta.pdf call over all
+    the pairs not seen before, and kept in BETA_PDFS (cleared once it holds
+    BETA_PDF_CACHE_SIZE curves), since integer counts recur across trials,
+    arms and plots.
+    """
+    alphas, betas = np.broadcast_arrays(np.asarray(alphas, dtype=float), np.asarray(betas, dtype=float))
+    pairs, inverse = np.unique(np.column_stack((alphas.ravel(), betas.ravel())), axis=0, return_inverse=True)
+    keys = [tuple(pair) for pair in pairs.tolist()]
+    missing = [i for i, key in enumerate(keys) if key not in BETA_PDFS]
+    if len(BETA_PDFS) + len(missing) > BETA_PDF_CACHE_SIZE:
+        BETA_PDFS.clear()
+        missing = range(len(keys))
+    if len(missing):
+        missing = np.asarray(missing)
+        pdfs = stats.beta.pdf(BETA_GRID, pairs[missing, :1], pairs[missing, 1:])
+        for i, pdf in zip(missing, pdfs):
+            BETA_PDFS[keys[i]] = pdf
+    unique_pdfs = np.stack([BETA_PDFS[key] for key in keys]) if keys else np.empty((0, len(BETA_GRID)))
+    return unique_pdfs[inverse.ravel()].reshape(alphas.shape + BETA_GRID.shape)
+
+
 def plot_beta_dist(df_ave, probabilities, idx, algorithm, legend_loc='upper left'):
     plt.figure(figsize=(10, 7))
+    pdfs = beta_pdfs(*beta_parameters(df_ave, idx, len(probabilities)))
     for arm in range(len(probabilities)):
-        x = np.arange (0, 1.001, 0.001)
-        y = stats.beta.pdf(x, df_ave['alpha_{}'.format(arm)].iloc[idx], df_ave['beta_{}'.format(arm)].iloc[idx])
-        plt.plot(x, y, label='arm_{}'.format(arm))
+        plt.plot(BETA_GRID, pdfs[arm], label='arm_{}'.format(arm))
     plt.legend(loc=legend_loc)
     plt.xlabel('Expected Reward')
     plt.ylabel('Probability Density')
@@ -191,6 +296,79 @@ def create_gif(algorithm, folder='images_for_gif'):
 #         display(Image(data=f.read(), format='png'))
 
 
+def render_beta_frames(alphas, betas, algorithm, legend_loc='upper left', dpi=100):
+    """
+    Renders the plot_beta_dist figure for each row of alphas and betas
+    (n_frames, n_arms) and returns the frames as RGB arrays. A single figure
+    is built and its lines updated in place, and nothing touches the disk.
+    """
+    fig = Figure(figsize=(10, 7), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    lines = [ax.plot(BETA_GRID, np.zeros_like(BETA_GRID), label='arm_{}'.format(arm))[0] for arm in range(alphas.shape[1])]
+    ax.legend(loc=legend_loc)
+    ax.set_xlabel('Expected Reward')
+    ax.set_ylabel('Probability Density')
+    ax.set_yticks([])
+    ax.set_title('Probability Distribution of Each Arm, {}'.format(algorithm))
+    fig.tight_layout()
+
+    frames = []
+    for pdfs in beta_pdfs(alphas, betas):
+        for line, y in zip(lines, pdfs):
+            line.set_ydata(y)
+        ax.relim()
+        ax.autoscale_view()
+        canvas.draw()
+        frames.append(np.asarray(canvas.buffer_rgba())[..., :3].copy())
+    return frames
+
+
+def render_gif_frames(alphas, betas, algorithm, legend_loc='upper left', dpi=100):
+    """
+    render_beta_frames, with each frame reduced to a palette image for the
+    GIF encoder. Quantizing is most of the cost of writing a GIF, so it is
+    done here, in the worker, rather than by the process writing the file.
+    """
+    return [PILImage.fromarray(frame).quantize(method=PILImage.Quantize.FASTOCTREE)
+            for frame in render_beta_frames(alphas, betas, algorithm, legend_loc, dpi)]
+
+
+def create_beta_gif(df_ave, probabilities, indices, algorithm, path=None, processes=None, frames_per_task=10,
+                    legend_loc='upper left', dpi=100, duration=100):
+    """
+    In-memory replacement for calling plot_beta_dist per index and then
+    create_gif. The frames for the rows of df_ave at indices are rendered
+    and quantized in a process pool, frames_per_task at a time. They are
+    handed to the GIF encoder in order as they arrive. Only a couple of
+    tasks per process are in flight at once, so finished RGB frames never
+    pile up. duration is the display time of each frame in milliseconds.
+    Returns the path written, gifs/<algorithm>.gif by default.
+    """
+    if len(indices) == 0:
+        raise ValueError('create_beta_gif needs at least one index to render')
+    path = 'gifs/{}.gif'.format(algorithm) if path is None else path
+    alphas, betas = beta_parameters(df_ave, indices, len(probabilities))
+    max_pending = 2 * (processes or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(processes) as executor:
+        def frames():
+            pending = deque()
+            for start in range(0, len(alphas), frames_per_task):
+                stop = start + frames_per_task
+                pending.append(executor.submit(render_gif_frames, alphas[start:stop], betas[start:stop], algorithm,
+                                               legend_loc, dpi))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+        stream = frames()
+        first = next(stream)
+        first.save(path, save_all=True, append_images=stream, duration=duration, loop=0)
+    return path
+
+
 def plot_beta_grid(df_ave, probabilities, algorithm, horizon, grid_length):
     indices = geomspace_indices(horizon, grid_length**2)
 
@@ -200,12 +378,11 @@ def plot_beta_grid(df_ave, probabilities, algorithm, horizon, grid_length):
     fig.subplots_adjust(top=0.88)
 
     ax = ax.ravel()
+    pdfs = beta_pdfs(*beta_parameters(df_ave, indices, len(probabilities)))
 
     for axis, idx in enumerate(indices):
         for arm in range(len(probabilities)):
-            x = np.arange (0, 1.001, 0.001)
-            y = stats.beta.pdf(x, df_ave['alpha_{}'.format(arm)].iloc[idx], df_ave['beta_{}'.format(arm)].iloc[idx])
-            ax[axis].plot(x, y, label='arm_{}'.format(arm))
+            ax[axis].plot(BETA_GRID, pdfs[axis, arm], label='arm_{}'.format(arm))
         ax[axis].set_title('Trial #{}'.format(idx))
 
     handles, labels = ax[axis].get_legend_handles_labels()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from streaming_summary import StreamingSummary
+
+
+class ResultStore():
+    """
+    Directory of sweep results kept on disk, so an interrupted run_sweep can
+    be started again and only run the chunks it is missing.
+
+    Each sweep gets its own folder, root/<algorithm>/<key>, where key hashes
+    everything its results depend on (hyperparameter values, arms, horizon,
+    number of simulations, seed, chunk size and run_sim options, the latter
+    by repr, so options meant to resume should be plain values). A completed
+    chunk is one folder holding a .npy file per column, written under a
+    temporary name and renamed into place, so a chunk folder only ever exists
+    once it is complete. Reads memory-map the columns.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def run(self, algorithm, hyperparameter, values, arms, horizon, num_sims, seed, chunk_size, **options):
+        """
+        Returns the StoredRun for one sweep, creating its folder on first use.
+        seed has to be given for the sweep to be resumable; without it every
+        run draws fresh entropy and lands in a folder of its own.
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        values = [value.item() if isinstance(value, np.generic) else value for value in values]
+        spec = {'algorithm': algorithm, 'hyperparameter': hyperparameter, 'values': values,
+                'arms': [describe_arm(arm) for arm in arms], 'horizon': horizon, 'num_sims': num_sims, 'seed': seed,
+                'chunk_size': chunk_size, 'options': options}
+        key = hashlib.sha1(json.dumps(spec, sort_keys=True, default=repr).encode()).hexdigest()[:16]
+        path = os.path.join(self.root, algorithm, key)
+        os.makedirs(path, exist_ok=True)
+        meta = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta):
+            with open(meta, 'w') as f:
+                json.dump(spec, f, sort_keys=True, indent=2, default=repr)
+        return StoredRun(path, hyperparameter, values)
+
+
+class StoredRun():
+    """
+    The chunks of one sweep in a ResultStore, addressed by the index of their
+    hyperparameter value and their first simulation number.
+    """
+    def __init__(self, path, hyperparameter, values):
+        self.path = path
+        self.hyperparameter = hyperparameter
+        self.values = list(values)
+
+    def chunk_path(self, value_index, start):
+        return os.path.join(self.path, '{}_{}'.format(value_index, start))
+
+    def has_chunk(self, value_index, start):
+        return os.path.isdir(self.chunk_path(value_index, start))
+
+    def chunk_keys(self):
+        keys = []
+        for name in os.listdir(self.path):
+            value_index, _, start = name.partition('_')
+            if value_index.isdigit() and start.isdigit():
+                keys.append((int(value_index), int(start)))
+        return sorted(keys)
+
+    def read_chunk(self, value_index, start, columns=None):
+        """
+        The per-trial frame of one chunk with the hyperparameter column in
+        front, loading only the columns asked for.
+        """
+        path = self.chunk_path(value_index, start)
+        with open(os.path.join(path, 'columns.json')) as f:
+            names = json.load(f)
+        if columns is not None:
+            names = [name for name in names if name in columns]
+        loaded = [np.load(os.path.join(path, '{}.npy'.format(name)), mmap_mode='r') for name in names]
+        data = {self.hyperparameter: np.repeat(self.values[value_index], len(loaded[0]) if loaded else 0)}
+        data.update(zip(names, loaded))
+        return pd.DataFrame(data, copy=False)
+
+    def chunks(self, columns=None):
+        """
+        Yields the per-trial frame of every stored chunk, one at a time.
+        """
+        for value_index, start in self.chunk_keys():
+            yield self.read_chunk(value_index, start, columns)
+
+    def to_dataframe(self, columns=None):
+        return pd.concat(self.chunks(columns), ignore_index=True)
+
+    def read_summary(self, value_index, start):
+        path = self.chunk_path(value_index, start)
+        with open(os.path.join(path, 'summary.json')) as f:
+            spec = json.load(f)
+        summary = StreamingSummary(spec['horizon'], spec['n_arms'], spec['variance'], spec['arm_means'])
+        summary.n = np.load(os.path.join(path, 'n.npy'))
+        summary.mean = np.load(os.path.join(path, 'mean.npy'))
+        if summary.variance:
+            summary.m2 = np.load(os.path.join(path, 'm2.npy'))
+        return summary
+
+
+def describe_arm(arm):
+    # the class and numeric parameters of an arm, leaving out its random state
+    description = {'type': type(arm).__name__}
+    description.update((name, value) for name, value in vars(arm).items() if isinstance(value, (int, float)))
+    return description
+
+
+def write_chunk(path, result):
+    """
+    Saves one chunk's output of run_chunk, a per-trial DataFrame or a
+    StreamingSummary, to the chunk folder path. Nothing is written if
+    another process got there first.
+    """
+    temporary = '{}.tmp{}'.format(path, os.getpid())
+    shutil.rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+    if isinstance(result, StreamingSummary):
+        result.flush()
+        spec = {'horizon': result.horizon, 'n_arms': result.n_arms, 'variance': result.variance,
+                'arm_means': None if result.arm_means is None else result.arm_means.tolist()}
+        with open(os.path.join(temporary, 'summary.json'), 'w') as f:
+            json.dump(spec, f)
+        arrays = {'n': result.n, 'mean': result.mean}
+        if result.variance:
+            arrays['m2'] = result.m2
+    else:
+        with open(os.path.join(temporary, 'columns.json'), 'w') as f:
+            json.dump(list(result.columns), f)
+        arrays = {name: result[name].values for name in result.columns}
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary, '{}.npy'.format(name)), array)
+    try:
+        os.rename(temporary, path)
+    except OSError:
+        shutil.rmtree(temporary, ignore_errors=True)
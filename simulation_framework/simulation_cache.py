@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+from simulation_framework import run_trials, expected_rewards
+from simulation_results import SimulationResults
+from stopping_rules import PosteriorStopping
+from result_store import describe_arm
+from state_snapshot import snapshot
+
+
+class SimulationCache():
+    """
+    Content-addressed disk cache of run_sim results.
+
+    An entry is keyed by the algorithm class and its parameters, the arms,
+    the seed and the stopping options. Horizon and number of simulations are
+    not part of the key. Simulation i is always seeded from child i of
+    np.random.SeedSequence(seed), so a request for fewer simulations or
+    trials than an entry holds is a slice of it. A request for more runs the
+    missing simulations and continues the stored ones from their saved
+    state (algorithm, arms and stopping policy), giving exactly what a
+    fresh run to the longer horizon would.
+
+    Entries are single files in root. The least recently used ones are
+    deleted whenever the directory grows beyond max_bytes.
+    """
+    def __init__(self, root, max_bytes=2 ** 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, algorithm_class, params, arms, seed, **options):
+        spec = {'algorithm': algorithm_class.__name__, 'params': params,
+                'arms': [describe_arm(arm) for arm in arms], 'seed': seed, 'options': options}
+        return hashlib.sha1(json.dumps(spec, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def run_sim(self, algorithm_class, params, arms, horizon, num_sims=1, seed=0, terminate=False, confidence=.95,
+                regret=.01, min_trials=1000, checkpoints=None, track_regret=False, every=100, method='auto'):
+        """
+        The SimulationResults of num_sims simulations of
+        algorithm_class(**params, n_arms=len(arms)) over horizon trials,
+        served from the cache where possible. checkpoints and track_regret
+        only shape the returned results, so they share entries.
+        """
+        path = os.path.join(self.root, '{}.pkl'.format(
+            self.key(algorithm_class, params, arms, seed, terminate=terminate, confidence=confidence,
+                     regret=regret, min_trials=min_trials, every=every, method=method)))
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path)
+        else:
+            entry = {'horizon': 0, 'sims': []}
+
+        changed = False
+        if horizon > entry['horizon']:
+            for simulation in entry['sims']:
+                self.extend(simulation, horizon)
+            entry['horizon'] = horizon
+            changed = True
+        for sim in range(len(entry['sims']), num_sims):
+            entry['sims'].append(self.start(algorithm_class, params, arms, seed, sim, terminate, confidence,
+                                            regret, min_trials, entry['horizon'], every, method))
+            changed = True
+        if changed:
+            self.save(path, entry)
+
+        results = SimulationResults(num_sims, horizon, len(arms), checkpoints,
+                                    expected_rewards(arms) if track_regret else None)
+        for sim, simulation in enumerate(entry['sims'][:num_sims]):
+            results.record_simulation(sim, *(simulation[name][:horizon] for name in
+                                             ('chosen_arm', 'reward', 'cumulative_reward', 'alpha', 'beta')))
+        return results.finalize()
+
+    def start(self, algorithm_class, params, arms, seed, sim, terminate, confidence, regret, min_trials, horizon,
+              every=100, method='auto'):
+        # same seeding as child sim of SeedSequence(seed).spawn(n) for any n > sim
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(sim,)))
+        arms = pickle.loads(pickle.dumps(arms))
+        for arm in arms:
+            arm.seed(rng)
+        algorithm = algorithm_class(**params, n_arms=len(arms), rng=rng)
+        stopping_policy = None
+        if terminate:
+            stopping_policy = PosteriorStopping(confidence, regret, min_trials, rng=algorithm.rng.generator,
+                                                every=every, method=method)
+        simulation = {'chosen_arm': np.zeros(0, dtype=np.int32), 'reward': np.zeros(0),
+                      'cumulative_reward': np.zeros(0), 'alpha': np.zeros((0, len(arms))),
+                      'beta': np.zeros((0, len(arms))), 'stopped': False,
+                      'state': snapshot((algorithm, arms, stopping_policy))}
+        self.extend(simulation, horizon)
+        return simulation
+
+    def extend(self, simulation, horizon):
+        """
+        Continues one stored simulation up to horizon trials, unless its
+        stopping policy already ended it.
+        """
+        start = len(simulation['chosen_arm'])
+        if simulation['stopped'] or start >= horizon:
+            return
+        algorithm, arms, stopping_policy = pickle.loads(simulation['state'])
+        cumulative_reward = simulation['cumulative_reward'][-1] if start else 0
+        recorder = SimulationResults(1, horizon, len(arms))
+        cumulative_reward, simulation['stopped'] = run_trials(algorithm, arms, recorder, 0, start, horizon,
+                                                              stopping_policy, cumulative_reward)
+        length = max(start, int(recorder.lengths[0]))
+        for name in ('chosen_arm', 'reward', 'cumulative_reward'):
+            simulation[name] = np.concatenate((simulation[name], getattr(recorder, name)[start:length]))
+        simulation['alpha'] = np.concatenate((simulation['alpha'], recorder.alpha[:, start:length].T))
+        simulation['beta'] = np.concatenate((simulation['beta'], recorder.beta[:, start:length].T))
+        simulation['state'] = snapshot((algorithm, arms, stopping_policy))
+
+    def save(self, path, entry):
+        temporary = '{}.tmp{}'.format(path, os.getpid())
+        with open(temporary, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.root, name)
+                status = os.stat(path)
+                entries.append((status.st_mtime, status.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
@@ -1,89 +1,222 @@
-import random
-from collections import deque
-
-
-def run_sim(algorithm, arms, horizon, num_sims=1, terminate=False, confidence=.95, regret=.01, min_trials=1000):
-    
-    chosen_arms = []
-    rewards = []
-    cumulative_rewards = []
-    sim_nums = []
-    trials = []
-    alpha = []
-    beta = []
-    optimal_arm_prob = 0
-    potential_value_remaining = 1
-    pvr_list = deque([0] * 100)
-    previous_idx = 0
-    previous_idx_flag = False
-    
+import time
+import numpy as np
+from simulation_results import SimulationResults
+from streaming_summary import StreamingSummary
+from stopping_rules import BestArmProbability, PosteriorStopping
+from thompson_sampling import posterior_draw, arm_of
+
+
+def run_sim(algorithm, arms, horizon, num_sims=1, terminate=False, confidence=.95, regret=.01, min_trials=1000,
+            checkpoints=None, aggregate=False, variance=False, recorder=None, stopping_policy=None,
+            track_regret=False, instrumentation=None, every=100, method='auto'):
+    """
+    Each simulation ends early once stopping_policy.should_stop returns True
+    (see stopping_rules). terminate=True without a policy uses the Thompson
+    Sampling rule, PosteriorStopping(confidence, regret, min_trials), which
+    works for any algorithm through its alpha and beta. It is checked every
+    `every` trials, with the best-arm probability computed by method
+    ('auto', 'integration' or 'sampling').
+
+    With track_regret=True the recorder also keeps regret, pseudo-regret,
+    whether the optimal arm was played and per-arm pull counts, computed
+    from the arms' known expected rewards (see expected_rewards).
+
+    Given an Instrumentation, every phase of every trial is timed into it
+    (see instrumentation); without one the trial loop carries no timing code.
+    """
+    if recorder is None:
+        results = new_recorder(num_sims, horizon, len(arms), checkpoints, aggregate, variance,
+                               expected_rewards(arms) if track_regret else None)
+    else:
+        results = recorder
+    if terminate and stopping_policy is None:
+        stopping_policy = PosteriorStopping(confidence, regret, min_trials, rng=algorithm.rng.generator,
+                                            every=every, method=method)
+
     for sim in range(num_sims):
         algorithm.reset()
-        for t in range(horizon):
-            idx = sim * horizon + t
-            if previous_idx_flag:
-                idx = previous_idx + t
-            sim_nums.append(sim)
-            trials.append(t)
-            
-            if 'Thompson' in str(algorithm):
-                rhos = algorithm.select_arm().copy()
-                if (t > min_trials) and terminate:
-                    expected_rewards = [alpha[idx-1][i] / (alpha[idx-1][i] + beta[idx-1][i]) for i in range(len(alpha[idx-1]))]
-                    expected_best_arm = expected_rewards.index(max(expected_rewards))
-                    theta_max = max(rhos)
-                    theta_star = rhos[expected_best_arm]
-                    pvr_list.popleft()
-                    pvr_list.append((theta_max - theta_star) / theta_star)
-                    potential_value_remaining = 0 if sum(pvr_list) == 0 else [i for i in pvr_list if i > 0][-1]
-                    if potential_value_remaining < regret:
-                        optimal_arm_prob = probability_of_expected_best_arm(algorithm, expected_best_arm)
-                        if optimal_arm_prob > confidence:
-                            previous_idx_flag = True
-                            previous_idx = idx - 1
-                            break
-                chosen_arm = random.choice([i for i, v in enumerate(rhos) if v == max(rhos)])
-
-            else:
-                chosen_arm = algorithm.select_arm()
-            chosen_arms.append(chosen_arm)
+        if stopping_policy is not None:
+            stopping_policy.reset()
+        if instrumentation is None:
+            run_trials(algorithm, arms, results, sim, 0, horizon, stopping_policy)
+        else:
+            run_trials_instrumented(algorithm, arms, results, sim, 0, horizon, stopping_policy, instrumentation)
+    return results.finalize()
+
+
+def run_trials(algorithm, arms, results, sim, start, stop, stopping_policy=None, cumulative_reward=0):
+    """
+    Plays trials start to stop - 1 of simulation sim from the algorithm's
+    current state, recording each one. start > 0 continues a simulation
+    left at trial start. Returns the cumulative reward and whether the
+    stopping policy ended the simulation.
+    """
+    for t in range(start, stop):
+        choice = algorithm.select_arm()
+        if stopping_policy is not None and stopping_policy.should_stop(algorithm, t, posterior_draw(choice)):
+            return cumulative_reward, True
+        chosen_arm = arm_of(choice)
+        reward = arms[chosen_arm].draw()
+        cumulative_reward += reward
+        results.record(sim, t, chosen_arm, reward, cumulative_reward, algorithm.alpha, algorithm.beta)
+        algorithm.update(chosen_arm, reward)
+    return cumulative_reward, False
+
+
+TRIAL_PHASES = ('select_arm', 'stopping_check', 'draw', 'record', 'update')
+
+
+def run_trials_instrumented(algorithm, arms, results, sim, start, stop, stopping_policy, instrumentation,
+                            cumulative_reward=0):
+    """
+    run_trials, timing each phase of every trial into instrumentation.
+    """
+    clock = time.perf_counter_ns
+    totals = [0] * len(TRIAL_PHASES)
+    maxima = [0] * len(TRIAL_PHASES)
+    iterations = trials = 0
+    stopped = False
+    instrumentation.simulation_started(sim)
+    for t in range(start, stop):
+        iterations += 1
+        t0 = clock()
+        choice = algorithm.select_arm()
+        t1 = clock()
+        stopped = stopping_policy is not None and stopping_policy.should_stop(algorithm, t, posterior_draw(choice))
+        t2 = clock()
+        if stopped:
+            durations = (t1 - t0, t2 - t1)
+        else:
+            chosen_arm = arm_of(choice)
             reward = arms[chosen_arm].draw()
-            rewards.append(reward)
-            alpha.append(algorithm.alpha.copy())
-            beta.append(algorithm.beta.copy())
-            if t == 0:
-                cumulative_rewards.append(reward)
-            else:
-                cumulative_rewards.append(cumulative_rewards[idx - 1] + reward)
+            t3 = clock()
+            cumulative_reward += reward
+            results.record(sim, t, chosen_arm, reward, cumulative_reward, algorithm.alpha, algorithm.beta)
+            t4 = clock()
             algorithm.update(chosen_arm, reward)
-            if t == horizon - 1:
-                previous_idx_flag = False
-    
-#         if 'Thompson' in str(algorithm):
-#             if terminate:
-#                 if t + 2 <= horizon:
-#                     print('The experiment ended after {} trials'.format(t + 1))
-#                 else:
-#                     print('The experiment ended at the horizon')
-#                 print('Optimal arm probability: {}'.format(optimal_arm_prob))
-#                 print('Potential value remaining: {}'.format(potential_value_remaining))
-    
-    return sim_nums, trials, chosen_arms, rewards, cumulative_rewards, alpha, beta
+            t5 = clock()
+            trials += 1
+            durations = (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)
+        for phase, duration in enumerate(durations):
+            totals[phase] += duration
+            if duration > maxima[phase]:
+                maxima[phase] = duration
+        if stopped:
+            break
+
+    calls = (iterations, iterations if stopping_policy is not None else 0, trials, trials, trials)
+    for phase, total, maximum, count in zip(TRIAL_PHASES, totals, maxima, calls):
+        if count:
+            instrumentation.add(phase, total, count, maximum)
+    instrumentation.simulation_ended(sim, trials, stopped)
+    return cumulative_reward, stopped
+
 
 def probability_of_expected_best_arm(algorithm, expected_best_arm):
-    count = 0
-    count_best_arm = 0
-    prob_new = 2
-    prob = 0
-    while count < 1000:
-        if count > 100:
-            if abs(prob_new - prob) < .001:
-                return prob_new
-        count +=1
-        prob = prob_new
-        rhos = algorithm.select_arm().copy()
-        chosen_arm = random.choice([i for i, v in enumerate(rhos) if v == max(rhos)])
-        if chosen_arm == expected_best_arm:
-            count_best_arm += 1
-        prob_new = count_best_arm / count
-    return prob_new
+    return BestArmProbability(rng=algorithm.rng.generator)(algorithm.alpha, algorithm.beta, expected_best_arm)
+
+
+def run_sim_vectorized(algorithm, arms, horizon, num_sims=1, checkpoints=None, aggregate=False, variance=False,
+                       recorder=None, rng=None, track_regret=False, instrumentation=None):
+    """
+    Same output as run_sim, but every simulation is stepped together using
+    the algorithm's vectorized counterpart (algorithm.vectorize), which keeps
+    the state of all simulations in (num_sims, n_arms) arrays.
+    Early termination is not supported here; every simulation runs to the horizon.
+    Rewards are drawn from rng, or from the algorithm's own generator if None.
+    instrumentation times the select_arms, draw, record and update steps.
+    """
+    batch = algorithm.vectorize(num_sims)
+    draw_rewards = reward_sampler(arms, batch.rng if rng is None else np.random.default_rng(rng))
+    if recorder is None:
+        results = new_recorder(num_sims, horizon, len(arms), checkpoints, aggregate, variance,
+                               expected_rewards(arms) if track_regret else None)
+    else:
+        results = recorder
+    cumulative_rewards = np.zeros(num_sims)
+    if instrumentation is not None:
+        return run_steps_instrumented(batch, draw_rewards, results, cumulative_rewards, horizon, instrumentation)
+
+    for t in range(horizon):
+        chosen_arms = batch.select_arms()
+        rewards = draw_rewards(chosen_arms)
+        cumulative_rewards += rewards
+        results.record_trial(t, chosen_arms, rewards, cumulative_rewards, batch.alpha, batch.beta)
+        batch.update(chosen_arms, rewards)
+    return results.finalize()
+
+
+def run_steps_instrumented(batch, draw_rewards, results, cumulative_rewards, horizon, instrumentation):
+    clock = time.perf_counter_ns
+    for sim in range(batch.num_sims):
+        instrumentation.simulation_started(sim)
+    for t in range(horizon):
+        t0 = clock()
+        chosen_arms = batch.select_arms()
+        t1 = clock()
+        rewards = draw_rewards(chosen_arms)
+        t2 = clock()
+        cumulative_rewards += rewards
+        results.record_trial(t, chosen_arms, rewards, cumulative_rewards, batch.alpha, batch.beta)
+        t3 = clock()
+        batch.update(chosen_arms, rewards)
+        t4 = clock()
+        instrumentation.add('select_arms', t1 - t0)
+        instrumentation.add('draw', t2 - t1)
+        instrumentation.add('record', t3 - t2)
+        instrumentation.add('update', t4 - t3)
+    for sim in range(batch.num_sims):
+        instrumentation.simulation_ended(sim, horizon, False)
+    return results.finalize()
+
+
+def new_recorder(num_sims, horizon, n_arms, checkpoints=None, aggregate=False, variance=False, arm_means=None):
+    """
+    With aggregate=True the simulations are folded into running per-trial
+    means as they go, and run_sim returns the df_ave frame of
+    summarize_results instead of the full per-trial results.
+    A recorder built here can also be passed to run_sim directly to keep
+    hold of it after the run.
+    """
+    if aggregate:
+        return StreamingSummary(horizon, n_arms, variance, arm_means)
+    return SimulationResults(num_sims, horizon, n_arms, checkpoints, arm_means)
+
+
+def expected_rewards(arms):
+    """
+    The expected reward of every arm: p for a BernoulliTrial, mu for a NormalTrial.
+    """
+    means = []
+    for arm in arms:
+        if hasattr(arm, 'p'):
+            means.append(arm.p)
+        elif hasattr(arm, 'mu'):
+            means.append(arm.mu)
+        else:
+            raise ValueError('regret needs the expected reward of every arm, {} has neither p nor mu'.format(arm))
+    return np.array(means, dtype=float)
+
+
+def reward_sampler(arms, rng):
+    """
+    Returns a function drawing one reward per entry of an array of chosen arms.
+    Bernoulli and normal arms are drawn from rng in a single call; any other
+    arm type falls back to one draw_batch() per distinct arm, or its own draw().
+    """
+    if all(hasattr(arm, 'p') for arm in arms):
+        p = np.array([arm.p for arm in arms])
+        return lambda chosen_arms: (rng.random(len(chosen_arms)) <= p[chosen_arms]).astype(int)
+    if all(hasattr(arm, 'mu') and hasattr(arm, 'sigma') for arm in arms):
+        mu = np.array([arm.mu for arm in arms])
+        sigma = np.array([arm.sigma for arm in arms])
+        return lambda chosen_arms: rng.normal(mu[chosen_arms], sigma[chosen_arms])
+    if all(hasattr(arm, 'draw_batch') for arm in arms):
+        def draw_rewards(chosen_arms):
+            rewards = np.empty(len(chosen_arms))
+            for arm in np.unique(chosen_arms):
+                pulls = chosen_arms == arm
+                rewards[pulls] = arms[arm].draw_batch(pulls.sum())
+            return rewards
+        return draw_rewards
+    return lambda chosen_arms: np.array([arms[arm].draw() for arm in chosen_arms])
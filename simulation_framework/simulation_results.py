@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+
+class SimulationResults():
+    """
+    Preallocated, typed storage for the output of run_sim.
+
+    Every simulation owns a fixed block of `horizon` rows, so the memory used
+    is known up front. Alpha and beta are only stored at the trials listed in
+    `checkpoints` (every trial by default, an empty list to skip them entirely).
+    Simulations which terminate early are compacted away by finalize().
+
+    Given the expected reward of every arm, arm_means, it also keeps the
+    cumulative pseudo-regret of each trial and the pull count of every arm
+    per simulation (`pulls`), see regret_columns().
+    """
+    def __init__(self, num_sims, horizon, n_arms, checkpoints=None, arm_means=None):
+        self.num_sims = num_sims
+        self.horizon = horizon
+        self.n_arms = n_arms
+        size = num_sims * horizon
+        self.sim_num = np.repeat(np.arange(num_sims, dtype=np.int32), horizon)
+        self.trial = np.tile(np.arange(horizon, dtype=np.int32), num_sims)
+        self.chosen_arm = np.zeros(size, dtype=np.int32)
+        self.reward = np.zeros(size)
+        self.cumulative_reward = np.zeros(size)
+        self.lengths = np.zeros(num_sims, dtype=np.int64)
+        self.compacted = False
+
+        if arm_means is None:
+            self.arm_means = None
+        else:
+            self.arm_means = np.asarray(arm_means, dtype=float)
+            self.gaps = self.arm_means.max() - self.arm_means
+            self.pseudo_regret = np.zeros(size)
+            self.pulls = np.zeros((num_sims, n_arms), dtype=np.int64)
+
+        if checkpoints is None:
+            self.checkpoints = np.arange(horizon)
+        else:
+            self.checkpoints = np.unique(np.asarray(checkpoints, dtype=np.int64))
+            self.checkpoints = self.checkpoints[(self.checkpoints >= 0) & (self.checkpoints < horizon)]
+        self.every_trial = len(self.checkpoints) == horizon
+        self.checkpoint_slot = np.full(horizon, -1, dtype=np.int64)
+        self.checkpoint_slot[self.checkpoints] = np.arange(len(self.checkpoints))
+        # one contiguous row per arm, so alpha[arm] can be handed to pandas as is
+        self.alpha = np.full((n_arms, num_sims * len(self.checkpoints)), np.nan)
+        self.beta = np.full((n_arms, num_sims * len(self.checkpoints)), np.nan)
+
+    def __len__(self):
+        return int(self.lengths.sum()) if self.compacted else self.num_sims * self.horizon
+
+    def __iter__(self):
+        # lets the results still be unpacked like the tuple run_sim used to return
+        alpha_beta = self.alpha_beta_columns()
+        alphas = np.column_stack([alpha_beta['alpha_{}'.format(arm)] for arm in range(self.n_arms)])
+        betas = np.column_stack([alpha_beta['beta_{}'.format(arm)] for arm in range(self.n_arms)])
+        return iter((self.sim_num, self.trial, self.chosen_arm, self.reward, self.cumulative_reward, alphas, betas))
+
+    def record(self, sim, t, chosen_arm, reward, cumulative_reward, alpha, beta):
+        idx = sim * self.horizon + t
+        self.chosen_arm[idx] = chosen_arm
+        self.reward[idx] = reward
+        self.cumulative_reward[idx] = cumulative_reward
+        if self.arm_means is not None:
+            self.pseudo_regret[idx] = (self.pseudo_regret[idx - 1] if t else 0.) + self.gaps[chosen_arm]
+            self.pulls[sim, chosen_arm] += 1
+        slot = self.checkpoint_slot[t]
+        if slot >= 0:
+            row = sim * len(self.checkpoints) + slot
+            self.alpha[:, row] = alpha
+            self.beta[:, row] = beta
+        self.lengths[sim] = t + 1
+
+    def record_trial(self, t, chosen_arms, rewards, cumulative_rewards, alpha, beta):
+        """
+        Records trial t of every simulation at once; alpha and beta are (num_sims, n_arms).
+        """
+        self.chosen_arm[t::self.horizon] = chosen_arms
+        self.reward[t::self.horizon] = rewards
+        self.cumulative_reward[t::self.horizon] = cumulative_rewards
+        if self.arm_means is not None:
+            previous = self.pseudo_regret[t - 1::self.horizon] if t else 0.
+            self.pseudo_regret[t::self.horizon] = previous + self.gaps[chosen_arms]
+            self.pulls[np.arange(self.num_sims), chosen_arms] += 1
+        slot = self.checkpoint_slot[t]
+        if slot >= 0:
+            self.alpha[:, slot::len(self.checkpoints)] = alpha.T
+            self.beta[:, slot::len(self.checkpoints)] = beta.T
+        self.lengths[:] = t + 1
+
+    def record_simulation(self, sim, chosen_arms, rewards, cumulative_rewards, alpha, beta):
+        """
+        Records the first len(chosen_arms) trials of simulation sim at once;
+        alpha and beta are (trials, n_arms).
+        """
+        length = len(chosen_arms)
+        rows = slice(sim * self.horizon, sim * self.horizon + length)
+        self.chosen_arm[rows] = chosen_arms
+        self.reward[rows] = rewards
+        self.cumulative_reward[rows] = cumulative_rewards
+        if self.arm_means is not None:
+            self.pseudo_regret[rows] = np.cumsum(self.gaps[chosen_arms])
+            self.pulls[sim] = np.bincount(chosen_arms, minlength=self.n_arms)
+        recorded = self.checkpoints[self.checkpoints < length]
+        slots = sim * len(self.checkpoints) + np.arange(len(recorded))
+        self.alpha[:, slots] = alpha[recorded].T
+        self.beta[:, slots] = beta[recorded].T
+        self.lengths[sim] = length
+
+    def finalize(self):
+        """
+        Packs the rows of simulations that stopped before the horizon together
+        in place and trims every column to the rows actually recorded.
+        """
+        if self.compacted:
+            return self
+        columns = [self.sim_num, self.trial, self.chosen_arm, self.reward, self.cumulative_reward]
+        if self.arm_means is not None:
+            columns.append(self.pseudo_regret)
+        if self.every_trial:
+            columns.extend(self.alpha)
+            columns.extend(self.beta)
+        position = 0
+        for sim in range(self.num_sims):
+            start = sim * self.horizon
+            length = self.lengths[sim]
+            if start != position:
+                for column in columns:
+                    column[position:position + length] = column[start:start + length]
+            position += length
+        self.sim_num = self.sim_num[:position]
+        self.trial = self.trial[:position]
+        self.chosen_arm = self.chosen_arm[:position]
+        self.reward = self.reward[:position]
+        self.cumulative_reward = self.cumulative_reward[:position]
+        if self.arm_means is not None:
+            self.pseudo_regret = self.pseudo_regret[:position]
+        if self.every_trial:
+            self.alpha = self.alpha[:, :position]
+            self.beta = self.beta[:, :position]
+        self.compacted = True
+        return self
+
+    def columns(self):
+        self.finalize()
+        return {'sim_num': self.sim_num,
+                'trial': self.trial,
+                'chosen_arm': self.chosen_arm,
+                'reward': self.reward,
+                'cumulative_reward': self.cumulative_reward}
+
+    def regret_columns(self):
+        """
+        Per-row regret metrics, empty unless arm_means were given:
+        regret, the best arm's expected cumulative reward minus the one
+        obtained; pseudo_regret, the summed gaps between the best arm's
+        mean and the chosen arms' means; and optimal, whether the chosen
+        arm has the best mean.
+        """
+        self.finalize()
+        if self.arm_means is None:
+            return {}
+        return {'regret': self.arm_means.max() * (self.trial + 1) - self.cumulative_reward,
+                'pseudo_regret': self.pseudo_regret,
+                'optimal': self.gaps[self.chosen_arm] == 0}
+
+    def alpha_beta_columns(self):
+        """
+        Alpha and beta aligned with the rows of columns(). Views when every trial
+        is a checkpoint; otherwise NaN-filled outside the checkpoints.
+        """
+        self.finalize()
+        if self.every_trial:
+            alpha, beta = self.alpha, self.beta
+        else:
+            rows = (self.sim_offsets()[:, None] + self.checkpoints[None, :]).ravel()
+            recorded = (self.checkpoints[None, :] < self.lengths[:, None]).ravel()
+            alpha = np.full((self.n_arms, len(self)), np.nan)
+            beta = np.full((self.n_arms, len(self)), np.nan)
+            alpha[:, rows[recorded]] = self.alpha[:, recorded]
+            beta[:, rows[recorded]] = self.beta[:, recorded]
+        columns = {}
+        for arm in range(self.n_arms):
+            columns['alpha_{}'.format(arm)] = alpha[arm]
+            columns['beta_{}'.format(arm)] = beta[arm]
+        return columns
+
+    def checkpoint_frame(self):
+        """
+        Alpha and beta of each simulation at the recorded checkpoints only.
+        """
+        self.finalize()
+        sim_num = np.repeat(np.arange(self.num_sims, dtype=np.int32), len(self.checkpoints))
+        trial = np.tile(self.checkpoints, self.num_sims)
+        recorded = trial < self.lengths[sim_num]
+        if self.every_trial:
+            rows = (self.sim_offsets()[sim_num] + trial)[recorded]
+        else:
+            rows = np.flatnonzero(recorded)
+        columns = {'sim_num': sim_num[recorded], 'trial': trial[recorded]}
+        for arm in range(self.n_arms):
+            columns['alpha_{}'.format(arm)] = self.alpha[arm][rows]
+            columns['beta_{}'.format(arm)] = self.beta[arm][rows]
+        return pd.DataFrame(columns)
+
+    def sim_offsets(self):
+        # first row of each simulation once compacted
+        return np.concatenate(([0], np.cumsum(self.lengths)[:-1]))
+
+    def to_dataframe(self):
+        columns = self.columns()
+        columns.update(self.regret_columns())
+        columns.update(self.alpha_beta_columns())
+        return pd.DataFrame(columns, copy=False)
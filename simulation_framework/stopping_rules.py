@@ -0,0 +1,224 @@
+import math
+from bisect import bisect_left, insort
+from collections import deque
+import numpy as np
+from scipy import special
+
+
+class BestArmProbability():
+    """
+    Posterior probability that a given arm is the best one, for independent
+    Beta(alpha, beta) posteriors as kept by ThompsonSampling.
+
+    method='integration' evaluates P(arm is best) = E[prod_j F_j(theta_arm)]
+    on grid_size points spanning 8 standard deviations either side of the
+    arm's posterior mean, so the grid follows the posterior however
+    concentrated it gets. The result is deterministic and costs
+    O(n_arms * grid_size).
+    method='sampling' draws num_samples posterior vectors in one call and
+    counts how often the arm wins.
+    method='auto' integrates for up to max_integration_arms arms and samples
+    above that.
+
+    With every=k, a call at trial t reuses the last result for the same arm
+    until k trials have passed since it was computed. reset() clears it
+    between simulations.
+    """
+    def __init__(self, method='auto', num_samples=1000, grid_size=128, max_integration_arms=10, every=1, rng=None):
+        if method not in ('auto', 'integration', 'sampling'):
+            raise ValueError("method must be 'auto', 'integration' or 'sampling', got {}".format(method))
+        self.method = method
+        self.num_samples = num_samples
+        self.grid_size = grid_size
+        self.max_integration_arms = max_integration_arms
+        self.every = every
+        self.rng = np.random.default_rng(rng)
+        self.reset()
+
+    def reset(self):
+        self.last_t = None
+        self.last_arm = None
+        self.last_probability = None
+
+    def __call__(self, alpha, beta, arm, t=None):
+        if (t is not None and self.last_t is not None and arm == self.last_arm
+                and t - self.last_t < self.every):
+            return self.last_probability
+        alpha = np.asarray(alpha, dtype=float)
+        beta = np.asarray(beta, dtype=float)
+        if self.method == 'integration' or (self.method == 'auto' and len(alpha) <= self.max_integration_arms):
+            probability = self.integrate(alpha, beta, arm)
+        else:
+            probability = self.sample(alpha, beta, arm)
+        self.last_t, self.last_arm, self.last_probability = t, arm, probability
+        return probability
+
+    def integrate(self, alpha, beta, arm):
+        a, b = alpha[arm], beta[arm]
+        mean = a / (a + b)
+        sd = np.sqrt(a * b / ((a + b) ** 2 * (a + b + 1)))
+        lower, upper = max(0., mean - 8 * sd), min(1., mean + 8 * sd)
+        theta = lower + (upper - lower) * (np.arange(self.grid_size) + .5) / self.grid_size
+        # normalizing the density over the grid absorbs the discretization error of its mass
+        log_pdf = special.xlogy(a - 1, theta) + special.xlog1py(b - 1, -theta)
+        weights = np.exp(log_pdf - log_pdf.max())
+        others = np.arange(len(alpha)) != arm
+        cdfs = special.betainc(alpha[others, None], beta[others, None], theta)
+        return float(weights @ cdfs.prod(axis=0) / weights.sum())
+
+    def sample(self, alpha, beta, arm):
+        theta = self.rng.beta(alpha, beta, size=(self.num_samples, len(alpha)))
+        return float(np.mean(np.argmax(theta, axis=1) == arm))
+
+
+class ValueRemaining():
+    """
+    Potential value remaining, (theta_max - theta_best) / theta_best for a
+    posterior draw theta, monitored over the last `window` trials.
+
+    By default the monitor reports the most recent positive entry of the
+    window, or 0 once the whole window is zero. With quantile=q it reports the
+    q-quantile of the window instead, e.g. .95 for the usual "95th percentile
+    below 1%" rule. A running sum and a count of positive entries make each
+    update O(1). The quantile adds a sorted copy of the window, which costs
+    O(log window) to search plus a short memmove.
+
+    It only depends on the draws it is fed, so the same object serves
+    run_sim and a live deployment alike. value is inf until the first update.
+    """
+    def __init__(self, window=100, quantile=None):
+        self.window = window
+        self.quantile = quantile
+        self.reset()
+
+    def reset(self):
+        self.entries = deque([0.0] * self.window)
+        self.sorted_entries = [0.0] * self.window if self.quantile is not None else None
+        self.total = 0.0
+        self.positive = 0
+        self.last_positive = 0.0
+        self.value = math.inf
+
+    def update(self, value_remaining):
+        value_remaining = float(value_remaining)
+        old = self.entries.popleft()
+        self.entries.append(value_remaining)
+        self.total += value_remaining - old
+        self.positive += (value_remaining > 0) - (old > 0)
+        if value_remaining > 0:
+            self.last_positive = value_remaining
+        if self.quantile is not None:
+            del self.sorted_entries[bisect_left(self.sorted_entries, old)]
+            insort(self.sorted_entries, value_remaining)
+            self.value = self.sorted_entries[max(0, math.ceil(self.quantile * self.window) - 1)]
+        else:
+            self.value = self.last_positive if self.positive else 0.0
+        return self.value
+
+    def observe(self, theta, best_arm):
+        """
+        Updates with the value remaining of one posterior draw theta, given the expected best arm.
+        """
+        theta_star = theta[best_arm]
+        return self.update((np.max(theta) - theta_star) / theta_star)
+
+
+class StoppingPolicy():
+    """
+    Decides when a simulation has converged. run_sim calls reset() at the
+    start of every simulation, then should_stop(algorithm, t, theta) before
+    playing trial t, and ends the simulation as soon as it returns True.
+
+    Policies read only the algorithm's alpha and beta. Every algorithm keeps
+    them, with alpha - 1 holding an arm's reward sum and alpha + beta - 2 its
+    pull count. theta is the posterior draw when the algorithm's select_arm
+    returns one (ThompsonSampling), and None otherwise.
+    """
+    def reset(self):
+        pass
+
+    def should_stop(self, algorithm, t, theta=None):
+        raise NotImplementedError
+
+
+class PosteriorStopping(StoppingPolicy):
+    """
+    The Thompson Sampling rule: after min_trials, stop once the potential
+    value remaining is below regret and the expected best arm is best with
+    probability above confidence. Algorithms which don't draw from their
+    posterior get a draw from Beta(alpha, beta) using rng.
+
+    The rule is evaluated once every `every` trials, so the value remaining
+    window holds one draw per check; in between, should_stop is a single
+    comparison. method is the BestArmProbability method.
+    """
+    def __init__(self, confidence=.95, regret=.01, min_trials=1000, best_arm_probability=None,
+                 value_remaining=None, rng=None, every=100, method='auto'):
+        self.confidence = confidence
+        self.regret = regret
+        self.min_trials = min_trials
+        self.every = every
+        self.rng = np.random.default_rng(rng)
+        if best_arm_probability is None:
+            best_arm_probability = BestArmProbability(method, every=every, rng=self.rng)
+        self.best_arm_probability = best_arm_probability
+        self.value_remaining = ValueRemaining() if value_remaining is None else value_remaining
+        self.reset()
+
+    def reset(self):
+        self.best_arm_probability.reset()
+        self.value_remaining.reset()
+        self.optimal_arm_prob = 0
+        self.next_check = self.min_trials + 1
+
+    def should_stop(self, algorithm, t, theta=None):
+        if t < self.next_check:
+            return False
+        self.next_check = t + self.every
+        alpha, beta = np.asarray(algorithm.alpha), np.asarray(algorithm.beta)
+        expected_best_arm = int(np.argmax(alpha / (alpha + beta)))
+        if theta is None:
+            theta = self.rng.beta(alpha, beta)
+        if self.value_remaining.observe(theta, expected_best_arm) >= self.regret:
+            return False
+        self.optimal_arm_prob = self.best_arm_probability(alpha, beta, expected_best_arm, t)
+        return self.optimal_arm_prob > self.confidence
+
+
+class UCBGapStopping(StoppingPolicy):
+    """
+    Stops once the lower confidence bound of the empirically best arm clears
+    the upper confidence bound of every other arm. The Hoeffding radius
+    reward_range * sqrt(log(4 * n_arms * n**2 / delta) / (2 * n)) holds
+    for every arm and pull count n at once with probability 1 - delta, so
+    the identified arm is correct with probability at least 1 - delta.
+    """
+    def __init__(self, delta=.05, reward_range=1., min_trials=0):
+        self.delta = delta
+        self.reward_range = reward_range
+        self.min_trials = min_trials
+
+    def should_stop(self, algorithm, t, theta=None):
+        if t <= self.min_trials:
+            return False
+        alpha, beta = np.asarray(algorithm.alpha), np.asarray(algorithm.beta)
+        counts = alpha + beta - 2
+        if counts.min() < 1:
+            return False
+        means = (alpha - 1) / counts
+        radius = self.reward_range * np.sqrt(np.log(4 * len(counts) * counts ** 2 / self.delta) / (2 * counts))
+        best_arm = np.argmax(means)
+        upper = means + radius
+        upper[best_arm] = -np.inf
+        return means[best_arm] - radius[best_arm] > upper.max()
+
+
+class FixedBudgetStopping(StoppingPolicy):
+    """
+    Stops every simulation after budget trials.
+    """
+    def __init__(self, budget):
+        self.budget = budget
+
+    def should_stop(self, algorithm, t, theta=None):
+        return t >= self.budget
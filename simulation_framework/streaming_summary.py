@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+
+class StreamingSummary():
+    """
+    Running per-trial means of everything summarize_results averages, updated
+    while the simulations run, so the per-trial DataFrame is never built.
+    Memory is O(horizon * n_arms) whatever the number of simulations.
+
+    It records through the same record/record_trial/finalize calls as
+    SimulationResults; finalize() returns the df_ave frame directly. With
+    variance=True a Welford estimate (ddof=1, like pandas) of each column is
+    added as `<column>_var`. Given arm_means, the regret, pseudo_regret and
+    optimal columns of SimulationResults.regret_columns are averaged too.
+    """
+    def __init__(self, horizon, n_arms, variance=False, arm_means=None):
+        self.horizon = horizon
+        self.n_arms = n_arms
+        self.variance = variance
+        if arm_means is None:
+            self.arm_means = None
+        else:
+            self.arm_means = np.asarray(arm_means, dtype=float)
+            self.gaps = self.arm_means.max() - self.arm_means
+        n_columns = 2 + 4 * n_arms + (3 if arm_means is not None else 0)
+        self.n = np.zeros(horizon, dtype=np.int64)
+        self.mean = np.zeros((horizon, n_columns))
+        self.m2 = np.zeros((horizon, n_columns)) if variance else None
+
+        # rows of the simulation currently running through record()
+        self.current_sim = None
+        self.length = 0
+        self.chosen_arm = np.zeros(horizon, dtype=np.int64)
+        self.reward = np.zeros(horizon)
+        self.cumulative_reward = np.zeros(horizon)
+        self.alpha = np.zeros((horizon, n_arms))
+        self.beta = np.zeros((horizon, n_arms))
+
+        # per-simulation pull counts and pseudo-regret for record_trial()
+        self.arm_counts = None
+        self.pseudo_regret = None
+
+    def record(self, sim, t, chosen_arm, reward, cumulative_reward, alpha, beta):
+        if sim != self.current_sim:
+            self.flush()
+            self.current_sim = sim
+        self.chosen_arm[t] = chosen_arm
+        self.reward[t] = reward
+        self.cumulative_reward[t] = cumulative_reward
+        self.alpha[t] = alpha
+        self.beta[t] = beta
+        self.length = t + 1
+
+    def record_trial(self, t, chosen_arms, rewards, cumulative_rewards, alpha, beta):
+        """
+        Records trial t of every simulation at once; alpha and beta are (num_sims, n_arms).
+        """
+        num_sims = len(chosen_arms)
+        if self.arm_counts is None or t == 0:
+            self.arm_counts = np.zeros((num_sims, self.n_arms))
+            self.pseudo_regret = np.zeros(num_sims)
+        arms = np.zeros((num_sims, self.n_arms))
+        arms[np.arange(num_sims), chosen_arms] = 1
+        self.arm_counts += arms
+        columns = [rewards, cumulative_rewards, arms, self.arm_counts, alpha, beta]
+        if self.arm_means is not None:
+            gaps = self.gaps[chosen_arms]
+            self.pseudo_regret += gaps
+            columns.extend([self.arm_means.max() * (t + 1) - cumulative_rewards, self.pseudo_regret, gaps == 0])
+        self.merge(t, np.column_stack(columns))
+
+    def flush(self):
+        if self.length == 0:
+            return
+        length = self.length
+        arms = (self.chosen_arm[:length, None] == np.arange(self.n_arms)).astype(float)
+        columns = [self.reward[:length], self.cumulative_reward[:length], arms, arms.cumsum(axis=0),
+                   self.alpha[:length], self.beta[:length]]
+        if self.arm_means is not None:
+            gaps = self.gaps[self.chosen_arm[:length]]
+            columns.extend([self.arm_means.max() * np.arange(1, length + 1) - self.cumulative_reward[:length],
+                            gaps.cumsum(), gaps == 0])
+        values = np.column_stack(columns)
+        # one Welford step for each trial of the simulation
+        self.n[:length] += 1
+        delta = values - self.mean[:length]
+        self.mean[:length] += delta / self.n[:length, None]
+        if self.variance:
+            self.m2[:length] += delta * (values - self.mean[:length])
+        self.length = 0
+
+    def merge(self, t, values):
+        """
+        Combines a batch of observations of trial t into the running statistics
+        (Chan et al.'s parallel form of Welford's update).
+        """
+        n_a = self.n[t]
+        n_b = len(values)
+        mean_b = values.mean(axis=0)
+        n = n_a + n_b
+        delta = mean_b - self.mean[t]
+        self.mean[t] += delta * n_b / n
+        if self.variance:
+            self.m2[t] += ((values - mean_b) ** 2).sum(axis=0) + delta ** 2 * n_a * n_b / n
+        self.n[t] = n
+
+    def combine(self, other):
+        """
+        Merges the statistics of another summary over the same horizon and arms,
+        e.g. one computed by another process over a different set of simulations.
+        """
+        self.flush()
+        other.flush()
+        n = self.n + other.n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(n > 0, other.n / n, 0)[:, None]
+        delta = other.mean - self.mean
+        self.mean += delta * weight
+        if self.variance:
+            self.m2 += other.m2 + delta ** 2 * self.n[:, None] * weight
+        self.n = n
+        return self
+
+    def column_names(self):
+        names = ['reward', 'cumulative_reward']
+        names.extend(['arm_{}'.format(arm) for arm in range(self.n_arms)])
+        names.extend(['arm_{}_cumulative'.format(arm) for arm in range(self.n_arms)])
+        names.extend(['alpha_{}'.format(arm) for arm in range(self.n_arms)])
+        names.extend(['beta_{}'.format(arm) for arm in range(self.n_arms)])
+        if self.arm_means is not None:
+            names.extend(['regret', 'pseudo_regret', 'optimal'])
+        return names
+
+    def finalize(self):
+        """
+        Returns the per-trial means in the column order of summarize_results.
+        """
+        self.flush()
+        seen = self.n > 0
+        names = self.column_names()
+        columns = {'trial': np.arange(self.horizon)[seen]}
+        for name, column in zip(names, self.mean[seen].T):
+            columns[name] = column
+        df_ave = pd.DataFrame(columns)
+
+        alpha_beta = list(sum([('alpha_{}'.format(arm), 'beta_{}'.format(arm)) for arm in range(self.n_arms)], ()))
+        arm_list = list(sum([('arm_{}'.format(arm), 'arm_{}_cumulative'.format(arm)) for arm in range(self.n_arms)], ()))
+        order = ['trial', 'reward', 'cumulative_reward'] + arm_list + alpha_beta
+        if self.arm_means is not None:
+            order.extend(['regret', 'pseudo_regret', 'optimal'])
+
+        if self.variance:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                var = self.m2[seen] / (self.n[seen, None] - 1)
+            var[self.n[seen] < 2] = np.nan
+            for name, column in zip(names, var.T):
+                df_ave['{}_var'.format(name)] = column
+            order.extend(['{}_var'.format(name) for name in order[1:]])
+        return df_ave[order]
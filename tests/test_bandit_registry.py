@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'algorithms'), os.path.join(root, 'serving')]
+
+from bandit_registry import BanditRegistry
+from sharded_registry import ShardedRegistry
+
+
+@pytest.mark.parametrize('policy', BanditRegistry.policies)
+def test_select_arms_scalar_tenant(policy):
+    registry = BanditRegistry(3, 4, policy=policy, epsilon=.5, rng=0)
+    registry.update([1, 1], [2, 3], [1, 0])
+    for _ in range(20):
+        arm = registry.select_arms(1)
+        assert np.shape(arm) == ()
+        assert 0 <= arm < 4
+
+
+@pytest.mark.parametrize('policy', BanditRegistry.policies)
+def test_select_arms_keeps_tenant_shape(policy):
+    registry = BanditRegistry(3, 4, policy=policy, rng=0)
+    assert registry.select_arms([0, 2, 2]).shape == (3,)
+    assert registry.select_arms([[0, 1], [2, 0]]).shape == (2, 2)
+
+
+def test_sharded_registry_scalar_tenant():
+    with ShardedRegistry(5, 4, n_shards=2, policy='epsilon_greedy', rng=0) as registry:
+        arm = registry.select_arms(3)
+        assert np.shape(arm) == ()
+        registry.update(3, arm, 1)
+        assert registry.counts(3)[arm] == 1
+        assert registry.select_arms([3, 4]).shape == (2,)
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'algorithms'), os.path.join(root, 'serving')]
+
+from bandit_server import BanditServer
+from epsilon_greedy import EpsilonGreedy
+
+
+class RejectingEpsilonGreedy(EpsilonGreedy):
+    __slots__ = ()
+
+    def update_batch(self, chosen_arms, rewards):
+        if (rewards < 0).any():
+            raise ValueError('negative reward')
+        super().update_batch(chosen_arms, rewards)
+
+
+def test_failed_batch_is_raised_and_writer_survives():
+    async def scenario():
+        server = BanditServer(RejectingEpsilonGreedy(.1, 3, rng=0))
+        await server.start()
+        await server.update(0, -1.)
+        with pytest.raises(ValueError, match='negative reward'):
+            await asyncio.wait_for(server.flush(), 5)
+        assert server.updates_failed == 1
+        await server.update(1, 1.)
+        await asyncio.wait_for(server.stop(), 5)
+        assert server.updates_applied == 1
+        assert server.algorithm.counts[1] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stop_raises_a_failed_batch():
+    async def scenario():
+        server = BanditServer(RejectingEpsilonGreedy(.1, 3, rng=0))
+        await server.start()
+        await server.update(2, -1.)
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(server.stop(), 5)
+        assert server.tasks == []
+
+    asyncio.run(scenario())
+
+
+def test_update_before_start():
+    async def scenario():
+        server = BanditServer(EpsilonGreedy(.1, 3, rng=0))
+        with pytest.raises(RuntimeError, match='not started'):
+            await server.handle({'op': 'update', 'arm': 0, 'reward': 1})
+
+    asyncio.run(scenario())
@@ -0,0 +1,103 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'algorithms')]
+
+from fenwick_tree import FenwickTree, LogWeightTree
+
+
+def sample_counts(tree, draws):
+    # evenly spaced thresholds, so every arm's count is its share of draws up to one
+    thresholds = (np.arange(draws) + .5) / draws
+    return np.bincount([tree.sample(threshold) for threshold in thresholds.tolist()], minlength=tree.n_arms)
+
+
+@pytest.mark.parametrize('n_arms', [1, 2, 5, 8, 13, 100])
+def test_prefix_sums_and_updates_match_cumsum(n_arms):
+    rng = np.random.default_rng(n_arms)
+    weights = rng.random(n_arms)
+    tree = FenwickTree(weights.tolist())
+    for step in range(3 * n_arms + 10):
+        arm = int(rng.integers(n_arms))
+        # some weights drop to exactly 0
+        weights[arm] = rng.random() if step % 3 else 0.0
+        tree.update(arm, float(weights[arm]))
+        cumsum = np.concatenate(([0.0], np.cumsum(weights)))
+        assert np.allclose([tree.prefix_sum(n) for n in range(n_arms + 1)], cumsum)
+        assert np.isclose(tree.total, cumsum[-1])
+
+
+@pytest.mark.parametrize('n_arms', [2, 3, 8, 13])
+def test_sample_frequencies_follow_the_weights(n_arms):
+    rng = np.random.default_rng(n_arms)
+    weights = rng.random(n_arms)
+    weights[n_arms // 2] = 0.0
+    tree = FenwickTree([1.0] * n_arms)
+    for arm, weight in enumerate(weights.tolist()):
+        tree.update(arm, weight)
+    draws = 10000
+    counts = sample_counts(tree, draws)
+    assert np.all(np.abs(counts - draws * weights / weights.sum()) <= 1)
+    assert counts[n_arms // 2] == 0
+
+
+def test_sample_is_uniform_once_every_weight_is_zero():
+    tree = FenwickTree([1.0, 2.0, 3.0, 4.0, 5.0])
+    for arm in range(5):
+        tree.update(arm, 0.0)
+    assert np.array_equal(sample_counts(tree, 1000), [200] * 5)
+    tree.reset([0.0] * 5)
+    assert np.array_equal(sample_counts(tree, 1000), [200] * 5)
+
+
+def softmax(log_weights):
+    log_weights = np.asarray(log_weights)
+    weights = np.exp(log_weights - log_weights.max())
+    return weights / weights.sum()
+
+
+def check_probabilities(tree, sample=False):
+    probabilities = [tree.probability(arm) for arm in range(len(tree.log_weights))]
+    assert np.isclose(sum(probabilities), 1.0)
+    assert np.allclose(probabilities, softmax(tree.log_weights), rtol=1e-9, atol=1e-300)
+    if sample:
+        # sampling walks the same distribution
+        draws = 1000
+        counts = sample_counts(tree.tree, draws)
+        assert np.all(np.abs(counts - draws * softmax(tree.log_weights)) <= 1)
+
+
+@pytest.mark.parametrize('n_arms', [1, 4, 9])
+def test_log_weights_growing_past_the_headroom(n_arms):
+    rng = np.random.default_rng(n_arms)
+    log_weights = rng.random(n_arms).tolist()
+    tree = LogWeightTree(log_weights, headroom=50.0)
+    shifts = set()
+    for step in range(400):
+        arm = int(rng.integers(n_arms))
+        # climbs far beyond the float range of exp overall
+        tree.update(arm, tree.log_weights[arm] + float(rng.uniform(0, 40)))
+        shifts.add(tree.shift)
+        check_probabilities(tree, sample=step % 20 == 0)
+    assert max(tree.log_weights) > 1000
+    assert len(shifts) > 10
+    assert np.isclose(tree.log_total(), np.logaddexp.reduce(tree.log_weights))
+
+
+@pytest.mark.parametrize('n_arms', [2, 4, 9])
+def test_log_weights_collapsing_toward_underflow(n_arms):
+    rng = np.random.default_rng(n_arms)
+    tree = LogWeightTree([0.0] * n_arms, headroom=50.0)
+    shifts = set()
+    for step in range(400):
+        # the leading arm sinks below the rest every time, so the total would underflow without rebasing
+        arm = int(np.argmax(tree.log_weights))
+        tree.update(arm, tree.log_weights[arm] - float(rng.uniform(20, 60)))
+        shifts.add(tree.shift)
+        check_probabilities(tree, sample=step % 20 == 0)
+    assert max(tree.log_weights) < -1000
+    assert len(shifts) > 10
+    assert np.isclose(tree.log_total(), np.logaddexp.reduce(tree.log_weights))
@@ -0,0 +1,86 @@
+import os
+import sys
+from collections import Counter
+import numpy as np
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'algorithms')]
+
+from index_tree import UpperBoundTree
+from random_stream import RandomStream
+
+
+def bonus(weight):
+    return 2 * weight
+
+
+def best_arms(values, weights):
+    # the reference: every arm reaching the largest index
+    indices = np.asarray(values) + 2 * np.asarray(weights)
+    return set(np.flatnonzero(indices == indices.max()).tolist())
+
+
+def check_leaves(tree):
+    # every leaf is either free or holds exactly the arms of one key
+    assert len(tree.free_leaves) + len(tree.leaf_of_key) == tree.size
+    for key, leaf in tree.leaf_of_key.items():
+        assert tree.members[leaf]
+        for position, arm in enumerate(tree.members[leaf]):
+            assert tree.arm_leaf[arm] == leaf
+            assert tree.arm_position[arm] == position
+
+
+@pytest.mark.parametrize('n_arms', [1, 2, 5, 8, 13, 64])
+def test_argmax_matches_a_scan(n_arms):
+    generator = np.random.default_rng(n_arms)
+    rng = RandomStream(n_arms)
+    tree = UpperBoundTree(n_arms, 0.0, 0.0)
+    values, weights = [0.0] * n_arms, [0.0] * n_arms
+    for step in range(2000):
+        arm = int(generator.integers(n_arms))
+        # few distinct quarters, so keys repeat, leaves are freed and reused, and indices tie across keys
+        values[arm] = float(generator.integers(4)) / 4
+        weights[arm] = float(generator.integers(4)) / 4
+        tree.update(arm, values[arm], weights[arm])
+        assert tree.argmax(bonus, rng) in best_arms(values, weights)
+        if step % 100 == 0:
+            check_leaves(tree)
+    check_leaves(tree)
+
+
+def test_argmax_skips_untried_arms():
+    rng = RandomStream(0)
+    tree = UpperBoundTree(6)
+    tree.update(4, 0.1, 0.2)
+    assert tree.argmax(bonus, rng) == 4
+    tree.update(1, 0.9, 0.0)
+    assert tree.argmax(bonus, rng) == 1
+    tree.update(1, 0.0, 0.0)
+    assert tree.argmax(bonus, rng) == 4
+
+
+def test_argmax_breaks_ties_uniformly():
+    rng = RandomStream(0)
+    tree = UpperBoundTree(7, 0.0, 0.0)
+    # arms 0, 3 and 5 share a key; arm 6 ties them through a different value and weight
+    for arm, value, weight in [(0, .5, .5), (3, .5, .5), (5, .5, .5), (6, 1., .25), (2, .25, .25)]:
+        tree.update(arm, value, weight)
+    counts = Counter(tree.argmax(bonus, rng) for _ in range(8000))
+    assert set(counts) == {0, 3, 5, 6}
+    for arm in counts:
+        assert abs(counts[arm] / 8000 - .25) < .03
+
+
+def test_leaves_are_reused_after_a_key_disappears():
+    tree = UpperBoundTree(4)
+    for step in range(100):
+        # every update moves an arm to a fresh key, emptying its old leaf
+        tree.update(step % 4, float(step), 0.0)
+        check_leaves(tree)
+    assert len(tree.leaf_of_key) == 4
+    assert tree.argmax(bonus, RandomStream(0)) == 3
+    tree.reset()
+    check_leaves(tree)
+    tree.update(2, 0.0, 1.0)
+    assert tree.argmax(bonus, RandomStream(0)) == 2
@@ -0,0 +1,42 @@
+import os
+import sys
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'algorithms'), os.path.join(root, 'simulation_framework')]
+
+from stopping_rules import PosteriorStopping, ValueRemaining
+from thompson_sampling import ThompsonSampling
+
+
+class CountingValueRemaining(ValueRemaining):
+    def reset(self):
+        super().reset()
+        self.updates = 0
+
+    def update(self, value_remaining):
+        self.updates += 1
+        return super().update(value_remaining)
+
+
+def test_posterior_stopping_checks_every_k_trials():
+    algorithm = ThompsonSampling(3, rng=0)
+    value_remaining = CountingValueRemaining()
+    policy = PosteriorStopping(confidence=1., min_trials=100, value_remaining=value_remaining, rng=0, every=50)
+    for t in range(1000):
+        assert not policy.should_stop(algorithm, t)
+    # trials 101, 151, ..., 951
+    assert value_remaining.updates == 18
+    policy.reset()
+    assert value_remaining.updates == 0
+    assert not policy.should_stop(algorithm, 101)
+    assert value_remaining.updates == 1
+
+
+def test_posterior_stopping_every_trial():
+    algorithm = ThompsonSampling(3, rng=0)
+    value_remaining = CountingValueRemaining()
+    policy = PosteriorStopping(confidence=1., min_trials=10, value_remaining=value_remaining, rng=0, every=1)
+    for t in range(100):
+        policy.should_stop(algorithm, t)
+    assert value_remaining.updates == 89
@@ -0,0 +1,28 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(root, 'algorithms')]
+
+from ucb1 import UCB1
+from ucb2 import UCB2
+
+
+@pytest.mark.parametrize('make', [lambda n_arms: UCB1(n_arms, rng=0), lambda n_arms: UCB2(.5, n_arms, rng=0)])
+@pytest.mark.parametrize('n_arms', [5, 5000])
+def test_select_arms_tries_every_arm(make, n_arms):
+    algorithm = make(n_arms)
+    chosen_arms = algorithm.select_arms(n_arms)
+    assert sorted(chosen_arms.tolist()) == list(range(n_arms))
+
+
+@pytest.mark.parametrize('make', [lambda n_arms: UCB1(n_arms, rng=0), lambda n_arms: UCB2(.5, n_arms, rng=0)])
+def test_select_arms_fills_with_the_best_tried_arm(make):
+    algorithm = make(6)
+    algorithm.update_batch(np.arange(4), np.array([0., 0., 1., 0.]))
+    chosen_arms = algorithm.select_arms(10).tolist()
+    assert chosen_arms[:2] == [4, 5]
+    assert chosen_arms[2:] == [2] * 8
+    assert make(3).select_arms(7).tolist() == [0, 1, 2, 0, 1, 2, 0]